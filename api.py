@@ -0,0 +1,106 @@
+from datetime import date
+
+from flask import Blueprint, current_app, jsonify, request
+from flask.json import JSONEncoder
+
+import payloads
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#----------------------------------------------------------------------------#
+
+# Read-only views of venues, artists and shows built from the same payloads
+# as the HTML pages. Listings take:
+#   ?fields=a,b,c  select only these columns
+#   ?ids=1,2,3     fetch these records in one query (no paging)
+#   ?after= / ?before= / ?per_page=  keyset paging, as on the HTML listings
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+class ApiJSONEncoder(JSONEncoder):
+    def default(self, o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return JSONEncoder.default(self, o)
+
+
+api.json_encoder = ApiJSONEncoder
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(ApiError)
+def api_error(error):
+    return jsonify(error=error.message), error.status
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def http_error(error):
+    return jsonify(error=error.description), error.code
+
+
+def parse_ids(value):
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise ApiError('ids must be a comma-separated list of integers')
+    if len(ids) > current_app.config['MAX_PAGE_SIZE']:
+        raise ApiError('At most %d ids per request' % current_app.config['MAX_PAGE_SIZE'])
+    return ids
+
+
+def listing(resource, default_fields):
+    try:
+        fields = resource.parse_fields(request.args.get('fields'), default_fields)
+    except ValueError as e:
+        raise ApiError(str(e))
+    query = resource.select(fields)
+
+    if 'ids' in request.args:
+        ids = parse_ids(request.args['ids'])
+        rows = {resource.row_id(row): row for row in query.filter(resource.model.id.in_(ids))} if ids else {}
+        return jsonify(data=[resource.payload(rows[row_id], fields) for row_id in ids if row_id in rows])
+
+    page = resource.paginate(query)
+    return jsonify(
+        data=[resource.payload(row, fields) for row in page],
+        next=page.next_cursor,
+        prev=page.prev_cursor,
+    )
+
+
+@api.route('/venues')
+def venues():
+    return listing(payloads.venues, payloads.venues.fields)
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    venue = payloads.load_venue(venue_id)
+    if venue is None:
+        raise ApiError('No venue with id %d' % venue_id, 404)
+    return jsonify(payloads.venue_detail(venue))
+
+
+@api.route('/artists')
+def artists():
+    return listing(payloads.artists, payloads.artists.fields)
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    artist = payloads.load_artist(artist_id)
+    if artist is None:
+        raise ApiError('No artist with id %d' % artist_id, 404)
+    return jsonify(payloads.artist_detail(artist))
+
+
+@api.route('/shows')
+def shows():
+    return listing(payloads.shows, payloads.shows.fields)
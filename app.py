@@ -1,20 +1,44 @@
 #----------------------------------------------------------------------------#
 # Imports
 #----------------------------------------------------------------------------#
+import time
+started = time.perf_counter()
+
 import collections
 import collections.abc
+import functools
+import itertools
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from datetime import datetime, timedelta
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify, stream_with_context, \
+  before_render_template, template_rendered, get_flashed_messages
 from flask_migrate import Migrate
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
+from sqlalchemy.exc import IntegrityError
 from forms import *
-from models import db, Venue, Artist, Show
+from models import db, Venue, Artist, Show, show_foreign_keys
+from pagination import page_url
+from api import api
+import assets
+import booking
+import cache
+import compress
+import counters
+import exporter
+import facets
+import genres
+import importer
+import instrumentation
+import nplusone
+import payloads
+import replicas
+import search
+import startup
+import suggest
 
 collections.Callable = collections.abc.Callable 
 #----------------------------------------------------------------------------#
@@ -27,20 +51,72 @@ app.config.from_object('config')
 db.init_app(app)
 
 migrate = Migrate(app, db)
+assets.init_app(app)
+cache.init_app(app)
+compress.init_app(app)
+counters.init_app(app)
+exporter.init_app(app)
+importer.init_app(app)
+instrumentation.init_app(app)
+nplusone.init_app(app)
+replicas.init_app(app)
+search.init_app(app)
+suggest.init_app(app)
+app.register_blueprint(api)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+datetime_formats = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+# dateutil, babel and babel's locale data are loaded on first use rather than
+# at startup (Flask-WTF may already have imported babel for its i18n).
+@functools.lru_cache(maxsize=None)
+def datetime_locale():
+  import babel
+  return babel.Locale.parse('en')
+
+@functools.lru_cache(maxsize=None)
+def datetime_pattern(format):
+  import babel.dates
+  return babel.dates.parse_pattern(datetime_formats.get(format, format))
+
+# Listings repeat the same start times (many shows at the same hour), so
+# formatted values are memoized across renders.
+@functools.lru_cache(maxsize=4096)
+def format_datetime_cached(date, format):
+  return datetime_pattern(format).apply(date, datetime_locale())
+
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+  if not isinstance(value, datetime):
+    import dateutil.parser
+    value = dateutil.parser.parse(value)
+  return format_datetime_cached(value, format)
 
 app.jinja_env.filters['datetime'] = format_datetime
+app.jinja_env.globals['page_url'] = page_url
+
+# Long listings are sent as Jinja generates them, so the top of the page
+# leaves before the rows below it have been read from the database. The
+# signals keep render time in the request log as with render_template.
+def stream_template(template_name, **context):
+  template = app.jinja_env.get_template(template_name)
+  app.update_template_context(context)
+  # Takes the flashes out of the session while its cookie can still be
+  # sent; the layout's get_flashed_messages() gets the same ones later.
+  get_flashed_messages()
+  before_render_template.send(app, template=template, context=context)
+  def generate():
+    stream = template.stream(context)
+    stream.enable_buffering(app.config['TEMPLATE_STREAM_BUFFER'])
+    for chunk in stream:
+      yield chunk
+    template_rendered.send(app, template=template, context=context)
+  return Response(stream_with_context(generate()), mimetype='text/html')
 
 #----------------------------------------------------------------------------#
 # Controllers.
@@ -55,88 +131,39 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cache.cached_page
 def venues():
-  current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-  data = []
-  for Venues_one_city in Venue.query.distinct(Venue.state, Venue.city):
-    state = Venues_one_city.state
-    city = Venues_one_city.city
-    one_city_data = {}
-    venues = []
-    venue_query = Venue.query.filter(Venue.state == state, Venue.city == city).all()
-    for venue in venue_query:
-      upcoming_shows = venue.shows.filter(Show.start_time > current_time).all()
-      venues.append({
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": len(upcoming_shows)
-      })
-    data.append({
-      "city": city,
-      "state": state,
-      "venues": venues
-    })
-  return render_template('pages/venues.html', areas=data)
-  
+  filters = facets.active_filters(Venue)
+  query = payloads.venue_areas.select(payloads.venue_summary_fields + ['city', 'state'])
+  page = payloads.venue_areas.paginate(facets.apply(query, Venue, filters), stream=True)
+  cache.tag(cache.VENUES)
+  def summaries(rows):
+    for venue in rows:
+      cache.tag(cache.venue_tag(venue.id))
+      yield payloads.venue_areas.payload(venue, payloads.venue_summary_fields)
+  # The page is ordered by area, so each area's venues are contiguous.
+  areas = ({
+    "city": city,
+    "state": state,
+    "venues": summaries(rows)
+  } for (state, city), rows in itertools.groupby(page, key=lambda venue: (venue.state, venue.city)))
+  return stream_template('pages/venues.html', areas=areas, page=page, facets=facets.sidebar(Venue, filters))
+
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   search_term = request.form.get('search_term', '')
-  matched_venues = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
-  data = []
-  current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-  for venue in matched_venues:
-    upcoming_shows = venue.shows.filter(Show.start_time > current_time).all()
-    data.append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": len(upcoming_shows)
-    })
-  response = {
-    "count": len(matched_venues),
-    "data": data
-  }
+  response = search.search(Venue, search_term)
   return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/venues/<int:venue_id>')
+@cache.cached_page
 def show_venue(venue_id):
-  venue = db.session.query(Venue).filter(Venue.id == venue_id).one()
-  past_shows_query = db.session.query(Show).join(Venue).filter(Venue.id==venue_id).filter(Show.start_time<datetime.now()).all()
-  upcoming_shows_query = db.session.query(Show).join(Venue).filter(Venue.id==venue_id).filter(Show.start_time>datetime.now()).all()
-  past_shows = []
-  upcoming_shows = []
-  for show in past_shows_query:
-    past_shows.append({
-        "artist_id": show.artist_id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-        })
-  for show in upcoming_shows_query:
-    upcoming_shows.append({
-        "artist_id": show.artist_id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-        })
-  data = {
-      "id": venue.id,
-      "name": venue.name,
-      "genres": venue.genres,
-      "address": venue.address,
-      "city": venue.city,
-      "state": venue.state,
-      "phone": venue.phone,
-      "website": venue.website,
-      "facebook_link": venue.facebook_link,
-      "seeking_talent": venue.seeking_talent,
-      "seeking_description": venue.seeking_description,
-      "image_link": venue.image_link,
-      "past_shows": past_shows,
-      "upcoming_shows": upcoming_shows,
-      "past_shows_count": len(past_shows),
-      "upcoming_shows_count": len(upcoming_shows),
-  }
+  venue = payloads.load_venue(venue_id)
+  if venue is None:
+    abort(404)
+  cache.tag(cache.venue_tag(venue.id), *[cache.artist_tag(show.artist_id) for show in venue.show_list])
+  data = payloads.venue_detail(venue)
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
@@ -167,6 +194,7 @@ def create_venue_submission():
       )
       db.session.add(venue)
       db.session.commit()
+      cache.invalidate(cache.VENUES)
       flash('Venue ' + request.form['name'] + ' was successfully listed!')
     else:
       for field, message in form.errors.items():
@@ -179,12 +207,31 @@ def create_venue_submission():
       db.session.close()
   return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+# Deletes a venue or artist and its shows with one DELETE each, in the
+# current transaction. Returns the ids of the artists (venues) that had shows
+# with it, or None if there is no such venue (artist).
+def delete_with_shows(model, listing_id, deleted):
+  foreign_key = show_foreign_keys[model]
+  counterpart_key = show_foreign_keys[Artist] if model is Venue else show_foreign_keys[Venue]
+  counterpart_ids = [counterpart_id for counterpart_id, in db.session.query(counterpart_key).filter(foreign_key == listing_id).distinct()]
+  deleted(listing_id)
+  Show.query.filter(foreign_key == listing_id).delete(synchronize_session=False)
+  genres.remove(model, listing_id)
+  if not model.query.filter(model.id == listing_id).delete(synchronize_session=False):
+    return None
+  # Bulk deletes bypass the flush the search indexes listen to.
+  search.mark_changed(db.session(), model)
+  suggest.record(db.session(), model, listing_id)
+  return counterpart_ids
+
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   try:
-      venue = Venue.query.get_or_404(venue_id)
-      db.session.delete(venue)
+      artist_ids = delete_with_shows(Venue, venue_id, counters.venue_deleted)
+      if artist_ids is None:
+        abort(404)
       db.session.commit()
+      cache.invalidate(cache.venue_tag(venue_id), cache.VENUES, cache.SHOWS, *[cache.artist_tag(artist_id) for artist_id in artist_ids])
       flash('The venue has been removed together with all of its shows.')
       return render_template('pages/home.html')
   except ValueError:
@@ -201,75 +248,47 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cache.cached_page
 def artists():
-  artist_query = Artist.query.all()
-  data = []
-  for artist in artist_query:
-    data.append({
-      "id": artist.id,
-      "name": artist.name,
-    })
-  return render_template('pages/artists.html', artists=data)
+  filters = facets.active_filters(Artist)
+  page = payloads.artists.paginate(facets.apply(payloads.artists.select(payloads.artist_summary_fields), Artist, filters))
+  data = [payloads.artists.payload(artist, payloads.artist_summary_fields) for artist in page]
+  cache.tag(cache.ARTISTS, *[cache.artist_tag(artist.id) for artist in page])
+  return render_template('pages/artists.html', artists=data, page=page, facets=facets.sidebar(Artist, filters))
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
   search_term = request.form.get('search_term', '')
-  matched_artists = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
-  data = []
-  current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-  for artist in matched_artists:
-    upcoming_shows = artist.shows.filter(Show.start_time > current_time).all()
-    data.append({
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": len(upcoming_shows)
-    })
-  response = {
-    "count": len(matched_artists),
-    "data": data
-  }
+  response = search.search(Artist, search_term)
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 @app.route('/artists/<int:artist_id>')
+@cache.cached_page
 def show_artist(artist_id):
-  artist = db.session.query(Artist).filter(Artist.id == artist_id).one()
-  past_shows_query = db.session.query(Show).join(Artist).filter(Show.artist_id == artist_id).filter(Show.start_time<datetime.now()).all()
-  upcoming_shows_query = db.session.query(Show).join(Artist).filter(Show.artist_id == artist_id).filter(Show.start_time>datetime.now()).all()
-  past_shows = []
-  upcoming_shows = []
-  for show in past_shows_query:
-    past_shows.append({
-        "venue_id": show.venue_id,
-        "venue_name": show.venue.name,
-        "venue_image_link": show.venue.image_link,
-        "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-        })
-  for show in upcoming_shows_query:
-    upcoming_shows.append({
-        "venue_id": show.venue_id,
-        "venue_name": show.venue.name,
-        "venue_image_link": show.venue.image_link,
-        "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-        })
-  data = {
-      "id": artist.id,
-      "name": artist.name,
-      "genres": artist.genres,
-      "city": artist.city,
-      "state": artist.state,
-      "phone": artist.phone,
-      "website": artist.website,
-      "facebook_link": artist.facebook_link,
-      "seeking_venue": artist.seeking_venue,
-      "seeking_description": artist.seeking_description,
-      "image_link": artist.image_link,
-      "past_shows": past_shows,
-      "upcoming_shows": upcoming_shows,
-      "past_shows_count": len(past_shows),
-      "upcoming_shows_count": len(upcoming_shows),
-  }
+  artist = payloads.load_artist(artist_id)
+  if artist is None:
+    abort(404)
+  cache.tag(cache.artist_tag(artist.id), *[cache.venue_tag(show.venue_id) for show in artist.show_list])
+  data = payloads.artist_detail(artist)
   return render_template('pages/show_artist.html', artist=data)
 
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+  try:
+      venue_ids = delete_with_shows(Artist, artist_id, counters.artist_deleted)
+      if venue_ids is None:
+        abort(404)
+      db.session.commit()
+      cache.invalidate(cache.artist_tag(artist_id), cache.ARTISTS, cache.SHOWS, *[cache.venue_tag(venue_id) for venue_id in venue_ids])
+      flash('The artist has been removed together with all of their shows.')
+      return render_template('pages/home.html')
+  except ValueError:
+      db.session.rollback()
+      flash('Deletion failed.')
+  finally:
+      db.session.close()
+  return redirect(url_for('artists'))
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
@@ -286,6 +305,7 @@ def edit_artist_submission(artist_id):
     artist = Artist.query.get_or_404(artist_id)
     form.populate_obj(artist)
     db.session.commit()
+    cache.invalidate(cache.artist_tag(artist_id), cache.ARTISTS)
     flash('Artist: ' + form.name.data + 'was successfully updated!')
   except:
     db.session.rollback()
@@ -309,6 +329,7 @@ def edit_venue_submission(venue_id):
     venue = Venue.query.get_or_404(venue_id)
     form.populate_obj(venue)
     db.session.commit()
+    cache.invalidate(cache.venue_tag(venue_id), cache.VENUES)
     flash('Venue: ' + form.name.data + ' was successfully updated!')
   except:
     db.session.rollback()
@@ -345,6 +366,7 @@ def create_artist_submission():
       )
       db.session.add(artist)
       db.session.commit()
+      cache.invalidate(cache.ARTISTS)
       flash('Artist ' + request.form['name'] + ' was successfully listed!')
     else:
       for field, message in form.errors.items():
@@ -362,19 +384,50 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cache.cached_page
 def shows():
-  show_query = Show.query.all()
-  data = []
-  for show in show_query:
-    data.append({
-      "venue_id": show.venue.id,
-      "venue_name": show.venue.name,
-      "artist_id": show.artist.id,
-      "artist_name": show.artist.name,
-      "artist_image_link": show.artist.image_link,
-      "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
-    })
-  return render_template('pages/shows.html', shows=data)
+  try:
+    start = exporter.parse_bound(request.args.get('from'))
+    end = exporter.parse_bound(request.args.get('to'))
+  except ValueError:
+    abort(400)
+  # Defaults to the next SHOWS_WINDOW_DAYS days, so the page does not grow
+  # with the history of past shows.
+  if start is None:
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+  if end is None:
+    end = start + timedelta(days=app.config['SHOWS_WINDOW_DAYS'])
+  city = request.args.get('city', '').strip()
+
+  query = payloads.show_window(payloads.shows.select(payloads.show_summary_fields), start, end, city)
+  page = payloads.shows.paginate(query, stream=True)
+  cache.tag(cache.SHOWS)
+  def tiles():
+    for show in page:
+      cache.tag(cache.venue_tag(show.venue_id), cache.artist_tag(show.artist_id))
+      yield payloads.shows.payload(show, payloads.show_summary_fields)
+  days = [{
+    "date": day,
+    "count": count,
+    "url": url_for('shows', city=city or None, **{'from': day.isoformat(), 'to': (day + timedelta(days=1)).isoformat()})
+  } for day, count in payloads.shows_per_day(start, end, city)]
+  window = {"from": start.date().isoformat(), "to": end.date().isoformat(), "city": city}
+  return stream_template('pages/shows.html', shows=tiles(), page=page, days=days, window=window)
+
+@app.route('/shows/export.<format>')
+def export_shows(format):
+  if format not in exporter.export_formats:
+    abort(404)
+  try:
+    start = exporter.parse_bound(request.args.get('from'))
+    end = exporter.parse_bound(request.args.get('to'))
+  except ValueError:
+    abort(400)
+  return Response(
+    stream_with_context(exporter.export_lines(format, start, end)),
+    mimetype=exporter.export_formats[format],
+    headers={'Content-Disposition': 'attachment; filename=shows.%s' % format}
+  )
 
 @app.route('/shows/create')
 def create_shows():
@@ -382,25 +435,122 @@ def create_shows():
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
+# Checked before booking: SQLite would take orphan shows, Postgres fail the
+# insert. One query for both ids.
+def missing_references(venue_id, artist_id):
+  references = ((Venue, 'venue_id', venue_id), (Artist, 'artist_id', artist_id))
+  found = db.session.query(*[db.session.query(model.id).filter(model.id == row_id).exists()
+                             for model, key, row_id in references]).one()
+  return ['%s - No %s with id %s' % (key, key[:-3], row_id)
+          for (model, key, row_id), exists in zip(references, found) if not exists]
+
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
-  form = ShowForm(request.form)
+  form = ShowForm(request.form, meta={"csrf": False})
   try:
+      if not form.validate_on_submit():
+        for field, message in form.errors.items():
+          flash(field + ' - ' + str(message), 'danger')
+        raise ValueError
+      venue_id, artist_id = int(form.venue_id.data), int(form.artist_id.data)
+      missing = missing_references(venue_id, artist_id)
+      for message in missing:
+        flash(message, 'danger')
+      if missing:
+        raise ValueError
       show = Show(
-          artist_id=form.artist_id.data,
-          venue_id=form.venue_id.data,
-          start_time=form.start_time.data
+          artist_id=artist_id,
+          venue_id=venue_id,
+          start_time=form.start_time.data,
+          duration=booking.duration(form.duration.data)
       )
+      booking.check_show(show)
       db.session.add(show)
+      db.session.flush()
+      counters.show_added(show)
       db.session.commit()
+      cache.invalidate(cache.venue_tag(form.venue_id.data), cache.artist_tag(form.artist_id.data), cache.SHOWS)
       flash('Show  was successfully listed!')
+  except booking.Conflict as e:
+      db.session.rollback()
+      flash('Show could not be listed. %s' % e)
+  except IntegrityError as e:
+      db.session.rollback()
+      if not booking.exclusion_violation(e):
+        raise
+      # A concurrent booking won the race.
+      flash('Show could not be listed. The venue or artist is already booked then.')
   except ValueError as e:
       db.session.rollback()
+      if str(e):
+        flash(str(e), 'danger')
       flash('An error occurred. Show could not be listed.')
   finally:
       db.session.close()
   return render_template('pages/home.html')
 
+@app.route('/shows/create/recurring')
+def create_recurring_shows():
+  form = RecurringShowForm()
+  return render_template('forms/new_recurring_shows.html', form=form)
+
+@app.route('/shows/create/recurring', methods=['POST'])
+def create_recurring_shows_submission():
+  form = RecurringShowForm(request.form, meta={"csrf": False})
+  try:
+    if not form.validate_on_submit():
+      for field, message in form.errors.items():
+        flash(field + ' - ' + str(message), 'danger')
+      raise ValueError
+    venue_id, artist_id = int(form.venue_id.data), int(form.artist_id.data)
+    missing = missing_references(venue_id, artist_id)
+    for message in missing:
+      flash(message, 'danger')
+    if missing:
+      raise ValueError
+    duration = booking.duration(form.duration.data)
+    now = datetime.now()
+    slots = [booking.Slot(venue_id, artist_id, start, duration)
+             for start in booking.occurrences(form.start_time.data, form.frequency.data, form.count.data, form.until.data)]
+    past = [slot for slot in slots if slot.start <= now]
+    accepted, conflicts = booking.check([slot for slot in slots if slot.start > now])
+    # Every occurrence that fits goes in with one executemany and one commit.
+    rows = [{'venue_id': venue_id, 'artist_id': artist_id, 'start_time': slot.start, 'duration': duration}
+            for slot in accepted]
+    if rows:
+      db.session.execute(Show.__table__.insert(), rows)
+      counters.shows_added(rows)
+      db.session.commit()
+      cache.invalidate(cache.venue_tag(venue_id), cache.artist_tag(artist_id), cache.SHOWS)
+      flash('%d shows were successfully listed!' % len(rows))
+    conflicting = {id(slot): str(conflict) for slot, conflict in conflicts}
+    conflicting.update((id(slot), 'Already started; not listed.') for slot in past)
+    occurrences = [{'start': slot.start, 'end': slot.end, 'conflict': conflicting.get(id(slot))} for slot in slots]
+    return render_template('pages/recurring_shows.html', occurrences=occurrences, listed=len(rows))
+  except IntegrityError as e:
+    db.session.rollback()
+    if not booking.exclusion_violation(e):
+      raise
+    flash('Shows could not be listed. The venue or artist was booked meanwhile; please try again.')
+  except ValueError as e:
+    db.session.rollback()
+    if str(e):
+      flash(str(e), 'danger')
+    flash('An error occurred. Shows could not be listed.')
+  finally:
+    db.session.close()
+  return render_template('pages/home.html')
+
+@app.route('/suggest')
+def suggestions():
+  return jsonify(suggestions=suggest.suggest(request.args.get('q', ''), request.args.get('type')))
+
+# Lists cache keys and hit rates: for development only.
+if app.config['DEBUG']:
+  @app.route('/cache/stats')
+  def cache_stats():
+    return jsonify(cache.get_cache().stats())
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -420,6 +570,8 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+startup.init_app(app, started)
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+
+# Brotli variants are only built when the brotli package is installed;
+# browsers that accept br are then sent those, and gzip otherwise.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#----------------------------------------------------------------------------#
+# Static assets.
+#----------------------------------------------------------------------------#
+
+# `flask assets build` copies every file under static/ to static/dist/ with
+# a content hash in its name (css/main.css -> dist/css/main.1f2e3d4c5b6a.css),
+# precompresses the text formats to .gz (and .br) next to it, and writes a
+# manifest of the copies. The app loads the manifest once at startup:
+# url_for('static', filename='css/main.css') then points at the hashed copy,
+# which is served with an immutable far-future Cache-Control and the best
+# precompressed variant the browser accepts. Without a manifest static files
+# are served as they are.
+
+DIST_DIR = 'dist'
+HASH_LENGTH = 12
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.map', '.json', '.svg', '.txt', '.eot', '.otf', '.ttf'}
+
+# Relative url(...) references in stylesheets (fonts, images), rewritten to
+# the hashed copies; absolute, data: and unbuilt references are left alone.
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def hashed_name(path, content):
+    root, extension = posixpath.splitext(path)
+    return '%s.%s%s' % (root, hashlib.sha256(content).hexdigest()[:HASH_LENGTH], extension)
+
+
+def source_files(static_folder):
+    '''Paths under the static folder, relative and '/'-separated, stylesheets last.'''
+    paths = []
+    for directory, subdirectories, files in os.walk(static_folder):
+        subdirectories[:] = sorted(name for name in subdirectories
+                                   if not name.startswith('.') and os.path.join(directory, name) != os.path.join(static_folder, DIST_DIR))
+        for name in sorted(files):
+            if not name.startswith('.'):
+                paths.append(os.path.relpath(os.path.join(directory, name), static_folder).replace(os.sep, '/'))
+    return sorted(paths, key=lambda path: (path.endswith('.css'), path))
+
+
+def rewrite_css(path, content, manifest):
+    '''Point the relative url()s of the stylesheet at `path` to their hashed copies.'''
+    directory = posixpath.dirname(path)
+
+    def replace(match):
+        quote, target = match.groups()
+        if target.startswith(('/', 'data:', '#')) or '://' in target:
+            return match.group(0)
+        name, suffix = re.match(r'([^?#]*)(.*)', target).groups()
+        built = manifest.get(posixpath.normpath(posixpath.join(directory, name)))
+        if built is None:
+            return match.group(0)
+        # Hashing only renames the stylesheet, so its copy sits in the same
+        # directory under dist/.
+        relative = posixpath.relpath(built['path'], posixpath.join(DIST_DIR, directory))
+        return 'url(%s%s%s%s)' % (quote, relative, suffix, quote)
+
+    return CSS_URL.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def compressed_variants(content):
+    variants = {'gzip': ('.gz', gzip.compress(content, 9, mtime=0))}
+    if brotli is not None:
+        variants['br'] = ('.br', brotli.compress(content, quality=11))
+    return variants
+
+
+def build(static_folder):
+    '''Write the hashed and precompressed copies and the manifest; returns the manifest.'''
+    manifest = {}
+    for path in source_files(static_folder):
+        with open(os.path.join(static_folder, path), 'rb') as source:
+            content = source.read()
+        if path.endswith('.css'):
+            content = rewrite_css(path, content, manifest)
+        built = posixpath.join(DIST_DIR, hashed_name(path, content))
+        target = os.path.join(static_folder, built)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as output:
+            output.write(content)
+        encodings = []
+        if posixpath.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+            for encoding, (extension, compressed) in compressed_variants(content).items():
+                # Not worth a variant unless it saves something.
+                if len(compressed) < len(content):
+                    with open(target + extension, 'wb') as output:
+                        output.write(compressed)
+                    encodings.append(encoding)
+        manifest[path] = {'path': built, 'encodings': sorted(encodings)}
+    with open(os.path.join(static_folder, DIST_DIR, 'manifest.json'), 'w') as output:
+        json.dump(manifest, output, indent=2, sort_keys=True)
+    return manifest
+
+
+#----------------------------------------------------------------------------#
+# Serving.
+#----------------------------------------------------------------------------#
+
+# Preferred first when the browser accepts both.
+encoding_extensions = [('br', '.br'), ('gzip', '.gz')]
+
+
+class Assets(object):
+    def __init__(self, manifest):
+        self.urls = {path: built['path'] for path, built in manifest.items()}
+        self.encodings = {built['path']: built['encodings'] for built in manifest.values()}
+
+    def url_defaults(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.urls:
+            values['filename'] = self.urls[values['filename']]
+
+    def serve(self, filename):
+        encodings = self.encodings.get(filename)
+        if encodings is None:
+            return current_app.send_static_file(filename)
+        name, encoding = filename, None
+        for candidate, extension in encoding_extensions:
+            if candidate in encodings and request.accept_encodings[candidate]:
+                name, encoding = filename + extension, candidate
+                break
+        response = send_from_directory(current_app.static_folder, name,
+                                       mimetype=mimetypes.guess_type(filename)[0])
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % current_app.config['ASSETS_MAX_AGE']
+        return response
+
+
+def load_manifest(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as manifest:
+        return json.load(manifest)
+
+
+assets_cli = AppGroup('assets', help='Build the fingerprinted static assets.')
+
+
+@assets_cli.command('build')
+@click.option('--clean', is_flag=True, help='Remove earlier builds first.')
+def build_command(clean):
+    '''Hash, precompress and list every file under static/.'''
+    dist = os.path.join(current_app.static_folder, DIST_DIR)
+    if clean and os.path.isdir(dist):
+        shutil.rmtree(dist)
+    manifest = build(current_app.static_folder)
+    compressed = sum(1 for built in manifest.values() if built['encodings'])
+    click.echo('Built %d assets (%d precompressed%s) into %s' % (
+        len(manifest), compressed, '' if brotli else ', gzip only', dist))
+
+
+def init_app(app):
+    app.cli.add_command(assets_cli)
+    manifest = load_manifest(app.config['ASSETS_MANIFEST'])
+    if manifest is not None:
+        assets = app.extensions['assets'] = Assets(manifest)
+        app.url_defaults(assets.url_defaults)
+        app.view_functions['static'] = assets.serve
@@ -0,0 +1,114 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+#----------------------------------------------------------------------------#
+# python -m benchmarks
+#----------------------------------------------------------------------------#
+
+# Seeds a throwaway database (SQLite by default; any DATABASE_URL works,
+# including Postgres), drives every route through the Flask test client and
+# compares the numbers with benchmarks/baseline.json. Exits 1 on regression.
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+default_database = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur-benchmark.db')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark every Fyyur route.')
+    parser.add_argument('--database-url', default=default_database,
+                        help='Database to seed and benchmark; it is wiped unless --no-seed.')
+    parser.add_argument('--shows', type=int, default=1000, help='Shows to generate (1k to 1M).')
+    parser.add_argument('--venues', type=int, help='Venues to generate (default: shows / 10).')
+    parser.add_argument('--artists', type=int, help='Artists to generate (default: shows / 10).')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the data and the requests.')
+    parser.add_argument('--no-seed', action='store_true', help='Reuse the data already in the database.')
+    parser.add_argument('--requests', type=int, default=50, help='Timed requests per route.')
+    parser.add_argument('--route', action='append', help='Only benchmark these endpoints (repeatable).')
+    parser.add_argument('--page-cache', action='store_true', help='Leave the page cache on.')
+    parser.add_argument('--accept-encoding', default='gzip, deflate, br',
+                        help="Accept-Encoding sent with every request ('identity' for uncompressed sizes).")
+    parser.add_argument('--baseline', default=default_baseline, help='Baseline JSON to compare against.')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed latency/memory growth over the baseline, as a fraction.')
+    parser.add_argument('--output', help='Also write the results JSON here.')
+    parser.add_argument('--check-scans', action='store_true',
+                        help='Fail when a route runs a query that scans a whole table.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # config.py reads DATABASE_URL when the app is imported.
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import app
+    from models import db, Venue, Artist, Show
+    from benchmarks import explain, runner
+    from benchmarks.scenarios import Context, scenarios, check_coverage
+    from benchmarks.seed import seed
+
+    app.config.update(
+        TESTING=True,
+        WTF_CSRF_ENABLED=False,
+        PAGE_CACHE_ENABLED=args.page_cache,
+        REQUEST_LOG_SAMPLE_RATE=0,
+    )
+    missing = check_coverage(app)
+    if missing:
+        sys.exit('No benchmark scenario for:\n  ' + '\n  '.join(missing))
+
+    with app.app_context():
+        if args.no_seed:
+            venues, artists = Venue.query.count(), Artist.query.count()
+            shows = Show.query.count()
+        else:
+            venues, artists, shows = seed(args.shows, args.venues, args.artists, random_seed=args.seed)
+        db.session.remove()
+
+    context = Context(app, random.Random(args.seed), venues, artists)
+    results = {
+        'scale': {'venues': venues, 'artists': artists, 'shows': shows},
+        'dialect': args.database_url.split(':', 1)[0],
+        'requests': args.requests,
+        'accept_encoding': args.accept_encoding,
+        'routes': {},
+    }
+    client = app.test_client()
+    scans = []
+    for scenario in scenarios:
+        if args.route and scenario.endpoint not in args.route:
+            continue
+        # Debug-only routes (/cache/stats) are absent with DEBUG off.
+        if scenario.endpoint not in app.view_functions:
+            continue
+        results['routes'][scenario.name] = runner.measure(client, scenario, context, args.requests, args.accept_encoding)
+        if args.check_scans:
+            found = explain.sequential_scans(app, lambda: runner.perform(client, scenario.request(context), args.accept_encoding))
+            scans += ['%s: scans %s\n    %s' % (scenario.name, table, ' '.join(statement.split()))
+                      for table, statement in found if table not in scenario.full_scans]
+    print(runner.report(results))
+    if scans:
+        print('Sequential scans:\n  ' + '\n  '.join(scans))
+
+    if args.output:
+        runner.save_results(args.output, results)
+    if args.update_baseline:
+        runner.save_results(args.baseline, results)
+        print('Baseline written to %s' % args.baseline)
+    else:
+        baseline = runner.load_baseline(args.baseline)
+        if baseline is None:
+            print('No baseline at %s; run with --update-baseline to record one.' % args.baseline)
+        else:
+            regressions = runner.compare(results, baseline, args.tolerance)
+            if regressions:
+                sys.exit('Regressions against %s:\n  %s' % (args.baseline, '\n  '.join(regressions)))
+            print('No regressions against %s.' % args.baseline)
+    if scans:
+        sys.exit('%d queries scan a whole table.' % len(scans))
+
+if __name__ == '__main__':
+    main()
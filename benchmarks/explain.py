@@ -0,0 +1,101 @@
+import json
+import re
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db
+
+#----------------------------------------------------------------------------#
+# Sequential scan check.
+#----------------------------------------------------------------------------#
+
+# Replays one request per scenario, captures its statements and asks the
+# database for their plans. Postgres plans with enable_seqscan off, so it
+# picks an index whenever one can serve the query; a Seq Scan, or an index
+# scan without an index condition that is not just walking the index in
+# order under a LIMIT, then means the whole table is read. SQLite reports
+# full table scans as "SCAN <table>" without an index.
+
+sqlite_scan = re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?$')
+
+
+class StatementRecorder(object):
+    def __init__(self):
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self.record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, 'before_cursor_execute', self.record)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        if not executemany and not statement.lstrip().upper().startswith(('INSERT', 'EXPLAIN', 'SET', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')):
+            self.statements.append((statement, parameters))
+
+
+index_scans = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan')
+# Nodes that read all of their input before producing a row.
+blocking_nodes = ('Sort', 'Incremental Sort', 'Hash', 'Aggregate', 'Materialize', 'WindowAgg')
+
+
+def postgresql_scans(cursor, statement, parameters):
+    cursor.execute('SET LOCAL enable_seqscan = off')
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = []
+    # (node, relation of the enclosing bitmap heap scan, under an ordered LIMIT)
+    nodes = [(plan[0]['Plan'], None, False)]
+    while nodes:
+        node, relation, ordered = nodes.pop()
+        node_type = node['Node Type']
+        relation = node.get('Relation Name', relation)
+        if node_type == 'Seq Scan':
+            scans.append(relation)
+        elif node_type in index_scans and 'Index Cond' not in node and not ordered:
+            scans.append(relation)
+        if node_type == 'Limit':
+            ordered = True
+        elif node_type in blocking_nodes:
+            ordered = False
+        nodes.extend((child, relation, ordered) for child in node.get('Plans', []))
+    return scans
+
+
+def sqlite_scans(cursor, statement, parameters):
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    scans = []
+    for row in cursor.fetchall():
+        match = sqlite_scan.match(row[-1])
+        if match and match.group(1) in db.metadata.tables:
+            scans.append(match.group(1))
+    return scans
+
+
+explainers = {
+    'postgresql': postgresql_scans,
+    'sqlite': sqlite_scans,
+}
+
+
+def sequential_scans(app, perform):
+    '''(table, statement) for each full table scan in the statements of `perform()`.'''
+    with StatementRecorder() as recorder:
+        perform()
+    with app.app_context():
+        explain = explainers[db.engine.dialect.name]
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            found = []
+            for statement, parameters in recorder.statements:
+                for table in explain(cursor, statement, parameters):
+                    found.append((table, statement))
+            return found
+        finally:
+            connection.rollback()
+            connection.close()
@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+import tracemalloc
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Measurement.
+#----------------------------------------------------------------------------#
+
+# Each scenario is warmed up once, timed over --requests iterations (latency
+# percentiles, time to the first byte of the body, body size as sent with
+# --accept-encoding, statements per request), then repeated a few times under
+# tracemalloc for the peak Python allocation of one request. Memory is
+# measured separately because tracemalloc slows everything down.
+
+MEMORY_SAMPLES = 5
+
+
+class StatementCounter(object):
+    '''Statements run by this thread; background work (index rebuilds) is not the route's.'''
+
+    def __init__(self):
+        self.count = 0
+        self.thread = threading.get_ident()
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self.count_statement)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(Engine, 'before_cursor_execute', self.count_statement)
+
+    def count_statement(self, *args):
+        if threading.get_ident() == self.thread:
+            self.count += 1
+
+
+def percentile(values, p):
+    '''Nearest-rank percentile of a non-empty list.'''
+    values = sorted(values)
+    return values[max(0, -(-len(values) * p // 100) - 1)]
+
+
+def perform(client, request, accept_encoding=None):
+    '''Issue `request`; returns ms to the first byte of the body and the body size as sent.'''
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    started = time.perf_counter()
+    response = client.open(request['path'], method=request['method'], data=request['data'],
+                           headers=headers, buffered=False)
+    first_byte = None
+    size = 0
+    try:
+        for chunk in response.response:
+            if first_byte is None:
+                first_byte = time.perf_counter()
+            size += len(chunk)
+    finally:
+        response.close()
+    if response.status_code >= 400:
+        raise RuntimeError('%s %s returned %s' % (request['method'], request['path'], response.status))
+    return ((first_byte or time.perf_counter()) - started) * 1000, size
+
+
+def measure(client, scenario, context, requests, accept_encoding=None):
+    if scenario.prepare:
+        with context.app.app_context():
+            scenario.prepare(context)
+    perform(client, scenario.request(context), accept_encoding)
+
+    timings = []
+    first_bytes = []
+    sizes = []
+    statements = 0
+    with StatementCounter() as counter:
+        for i in range(requests):
+            # Statements of the scenario's setup are not the route's.
+            request = scenario.request(context)
+            before = counter.count
+            started = time.perf_counter()
+            first_byte, size = perform(client, request, accept_encoding)
+            timings.append((time.perf_counter() - started) * 1000)
+            first_bytes.append(first_byte)
+            sizes.append(size)
+            statements += counter.count - before
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for i in range(min(MEMORY_SAMPLES, requests)):
+            request = scenario.request(context)
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            perform(client, request, accept_encoding)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'ttfb_p50_ms': round(percentile(first_bytes, 50), 3),
+        'response_kb': round(sum(sizes) / len(sizes) / 1024, 1),
+        'queries': round(statements / requests, 2),
+        'peak_kb': round(max(peaks) / 1024, 1),
+    }
+
+
+#----------------------------------------------------------------------------#
+# Baseline.
+#----------------------------------------------------------------------------#
+
+# p50/p95 latency and memory may grow by --tolerance (a fraction) plus a small
+# absolute slack that absorbs noise on very fast routes; queries per request
+# may not grow at all. Time to first byte and response sizes are reported
+# but not compared.
+
+LATENCY_SLACK_MS = 1.0
+MEMORY_SLACK_KB = 64.0
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as baseline_file:
+            return json.load(baseline_file)
+    except FileNotFoundError:
+        return None
+
+
+def save_results(path, results):
+    with open(path, 'w', encoding='utf-8') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+        results_file.write('\n')
+
+
+def compare(results, baseline, tolerance):
+    '''Regression messages for `results` against `baseline`.'''
+    for key in ('scale', 'requests', 'accept_encoding'):
+        if results.get(key) != baseline.get(key):
+            return ['baseline was recorded with %s %s, this run used %s' % (key, baseline.get(key), results.get(key))]
+    regressions = []
+    for name, expected in sorted(baseline['routes'].items()):
+        actual = results['routes'].get(name)
+        if actual is None:
+            continue
+        for key, slack in (('p50_ms', LATENCY_SLACK_MS), ('p95_ms', LATENCY_SLACK_MS), ('peak_kb', MEMORY_SLACK_KB)):
+            limit = expected[key] * (1 + tolerance) + slack
+            if actual[key] > limit:
+                regressions.append('%s: %s %.1f > %.1f (baseline %.1f)' % (name, key, actual[key], limit, expected[key]))
+        if actual['queries'] > expected['queries']:
+            regressions.append('%s: queries %s > %s' % (name, actual['queries'], expected['queries']))
+    return regressions
+
+
+def report(results):
+    lines = ['%-40s %9s %9s %9s %9s %9s %8s %9s' % (
+        'route', 'p50 ms', 'p95 ms', 'p99 ms', 'ttfb ms', 'sent KB', 'queries', 'peak KB')]
+    for name, route in sorted(results['routes'].items()):
+        lines.append('%-40s %9.2f %9.2f %9.2f %9.2f %9.1f %8s %9.1f' % (
+            name, route['p50_ms'], route['p95_ms'], route['p99_ms'], route['ttfb_p50_ms'], route['response_kb'],
+            route['queries'], route['peak_kb']))
+    return '\n'.join(lines)
@@ -0,0 +1,209 @@
+import itertools
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import counters
+from importer import insert_rows
+from models import db, Venue, Artist, Show
+from benchmarks.seed import areas, artist_row, genres, name_words, venue_row
+
+#----------------------------------------------------------------------------#
+# Route scenarios.
+#----------------------------------------------------------------------------#
+
+# One scenario per (endpoint, method) in the app's URL map. Each builds the
+# request for one iteration from a Context; `check_coverage` fails the run
+# when a route has no scenario, so new routes cannot be left out.
+
+
+class Context(object):
+    def __init__(self, app, rng, venues, artists):
+        self.app = app
+        self.rng = rng
+        self.venues = venues
+        self.artists = artists
+
+    def venue_id(self):
+        return self.rng.randint(1, self.venues)
+
+    def artist_id(self):
+        return self.rng.randint(1, self.artists)
+
+    def word(self):
+        return self.rng.choice(name_words)
+
+
+class Scenario(object):
+    def __init__(self, endpoint, method, path, data=None, setup=None, prepare=None, full_scans=()):
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.data = data
+        # Untimed preparation (e.g. the row a DELETE removes); its result is
+        # passed to `path` and `data` instead of the context.
+        self.setup = setup
+        # Untimed, once before the warm-up request (e.g. loading an index).
+        self.prepare = prepare
+        # Tables the route reads in full by design (--check-scans).
+        self.full_scans = full_scans
+
+    @property
+    def name(self):
+        return '%s %s' % (self.method, self.endpoint)
+
+    def request(self, context):
+        arg = self.setup(context) if self.setup else context
+        return {
+            'method': self.method,
+            'path': self.path(arg) if callable(self.path) else self.path,
+            'data': self.data(arg) if callable(self.data) else self.data,
+        }
+
+
+def venue_form(context):
+    city, state = context.rng.choice(areas)
+    return {
+        'name': '%s Benchmark Hall' % context.word(),
+        'city': city,
+        'state': state,
+        'address': '1 Benchmark St',
+        'phone': '5550100',
+        'genres': context.rng.sample(genres, 2),
+        'facebook_link': 'https://www.facebook.com/benchmark',
+        'website_link': 'https://example.com/benchmark',
+        'image_link': 'https://example.com/benchmark.jpg',
+        'seeking_talent': 'y',
+        'seeking_description': 'Benchmark',
+    }
+
+
+def artist_form(context):
+    data = venue_form(context)
+    del data['address'], data['seeking_talent']
+    data['name'] = '%s Benchmark Band' % context.word()
+    data['seeking_venue'] = 'y'
+    return data
+
+
+# Seeded shows start within a year of now; each created show, or weekly
+# series, gets its own slot after that so none is turned away as a double
+# booking.
+show_slots = itertools.count()
+series_slots = itertools.count()
+SERIES_WEEKS = 12
+
+
+def show_form(context):
+    start_time = datetime.now() + timedelta(days=366, hours=3 * next(show_slots))
+    return {
+        'venue_id': context.venue_id(),
+        'artist_id': context.artist_id(),
+        'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def recurring_show_form(context):
+    start_time = datetime.now() + timedelta(days=800 + 7 * SERIES_WEEKS * next(series_slots))
+    return {
+        'venue_id': context.venue_id(),
+        'artist_id': context.artist_id(),
+        'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'frequency': 'weekly',
+        'count': SERIES_WEEKS,
+    }
+
+
+# Shows given to each venue or artist that a DELETE scenario removes.
+DISPOSABLE_SHOWS = 100
+
+
+def disposable(model, make_row):
+    '''Setup creating a venue or artist with shows for a DELETE to remove, so the seeded ids stay intact.'''
+    def setup(context):
+        with context.app.app_context():
+            listing = model(**make_row(context.rng, 0))
+            db.session.add(listing)
+            db.session.flush()
+            rows = []
+            for index in range(DISPOSABLE_SHOWS):
+                row = {
+                    'venue_id': listing.id if model is Venue else context.venue_id(),
+                    'artist_id': listing.id if model is Artist else context.artist_id(),
+                    'start_time': datetime.now() + timedelta(days=context.rng.randint(-365, 365)),
+                }
+                rows.append(row)
+            insert_rows(Show.__table__, rows)
+            counters.shows_added(rows)
+            db.session.commit()
+            return listing.id
+    return setup
+
+
+def genre_listing(path):
+    '''A listing narrowed to one genre facet.'''
+    return lambda context: '%s?%s' % (path, urlencode({'genre': context.rng.choice(genres)}))
+
+
+def export_window(context):
+    start = datetime.now() + timedelta(days=context.rng.randint(-30, 30))
+    return '/shows/export.jsonl?from=%s&to=%s' % (start.date().isoformat(), (start + timedelta(days=7)).date().isoformat())
+
+
+scenarios = [
+    Scenario('index', 'GET', '/'),
+    Scenario('static', 'GET', '/static/css/main.css'),
+
+    # Facet counts aggregate over the whole table (one index-only pass per facet).
+    Scenario('venues', 'GET', genre_listing('/venues'), full_scans=('Venue', 'venue_genres')),
+    # The in-process search index is built from a full read of the table, and
+    # the trigram indexes of the SQL backend only exist after `flask db upgrade`.
+    Scenario('search_venues', 'POST', '/venues/search', data=lambda c: {'search_term': c.word()},
+             full_scans=('Venue',)),
+    Scenario('show_venue', 'GET', lambda c: '/venues/%d' % c.venue_id()),
+    Scenario('create_venue_form', 'GET', '/venues/create'),
+    Scenario('create_venue_submission', 'POST', '/venues/create', data=venue_form),
+    Scenario('delete_venue', 'DELETE', lambda venue_id: '/venues/%d' % venue_id, setup=disposable(Venue, venue_row)),
+    Scenario('edit_venue', 'GET', lambda c: '/venues/%d/edit' % c.venue_id()),
+    Scenario('edit_venue_submission', 'POST', lambda c: '/venues/%d/edit' % c.venue_id(), data=venue_form),
+
+    Scenario('artists', 'GET', genre_listing('/artists'), full_scans=('Artist', 'artist_genres')),
+    Scenario('search_artists', 'POST', '/artists/search', data=lambda c: {'search_term': c.word()},
+             full_scans=('Artist',)),
+    Scenario('show_artist', 'GET', lambda c: '/artists/%d' % c.artist_id()),
+    Scenario('create_artist_form', 'GET', '/artists/create'),
+    Scenario('create_artist_submission', 'POST', '/artists/create', data=artist_form),
+    Scenario('edit_artist', 'GET', lambda c: '/artists/%d/edit' % c.artist_id()),
+    Scenario('edit_artist_submission', 'POST', lambda c: '/artists/%d/edit' % c.artist_id(), data=artist_form),
+    Scenario('delete_artist', 'DELETE', lambda artist_id: '/artists/%d' % artist_id, setup=disposable(Artist, artist_row)),
+
+    Scenario('shows', 'GET', '/shows'),
+    # A bulk read: hash joins against all venues and artists are fair game.
+    Scenario('export_shows', 'GET', export_window, full_scans=('Venue', 'Artist')),
+    Scenario('create_shows', 'GET', '/shows/create'),
+    Scenario('create_show_submission', 'POST', '/shows/create', data=show_form),
+    Scenario('create_recurring_shows', 'GET', '/shows/create/recurring'),
+    Scenario('create_recurring_shows_submission', 'POST', '/shows/create/recurring', data=recurring_show_form),
+
+    # Typing: the first one to four letters of a name word, answered from an
+    # index that is fresh, so that no rebuild or recount falls in the loop.
+    Scenario('suggestions', 'GET', lambda c: '/suggest?q=%s' % c.word()[:c.rng.randint(1, 4)],
+             prepare=lambda c: c.app.extensions['suggest'].load()),
+    Scenario('cache_stats', 'GET', '/cache/stats'),
+
+    Scenario('api.venues', 'GET', '/api/v1/venues'),
+    Scenario('api.venue', 'GET', lambda c: '/api/v1/venues/%d' % c.venue_id()),
+    Scenario('api.artists', 'GET', '/api/v1/artists'),
+    Scenario('api.artist', 'GET', lambda c: '/api/v1/artists/%d' % c.artist_id()),
+    Scenario('api.shows', 'GET', '/api/v1/shows'),
+]
+
+
+def check_coverage(app):
+    '''(endpoint, method) pairs of the app that no scenario drives.'''
+    covered = {(scenario.endpoint, scenario.method) for scenario in scenarios}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            if (rule.endpoint, method) not in covered:
+                missing.append('%s %s (%s)' % (method, rule.endpoint, rule.rule))
+    return missing
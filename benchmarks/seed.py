@@ -0,0 +1,118 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+from forms import genre_choices
+from genres import sync_since
+from importer import insert_rows
+from models import db, Venue, Artist, Show, ShowCounterState
+
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#----------------------------------------------------------------------------#
+
+# A deterministic (for a given --seed) catalogue of venues, artists and shows.
+# Ids are assigned by the database in insertion order, so a freshly created
+# schema holds venues 1..N and artists 1..M. The shows are generated twice
+# from the same seed: first to work out the upcoming-show counters (a
+# `counters.rebuild` is slow on millions of rows), then to insert them.
+
+areas = [
+    ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('San Diego', 'CA'),
+    ('New York', 'NY'), ('Brooklyn', 'NY'), ('Chicago', 'IL'),
+    ('Austin', 'TX'), ('Houston', 'TX'), ('Seattle', 'WA'),
+    ('Portland', 'OR'), ('Denver', 'CO'), ('Nashville', 'TN'),
+    ('New Orleans', 'LA'), ('Atlanta', 'GA'), ('Boston', 'MA'),
+    ('Philadelphia', 'PA'), ('Detroit', 'MI'), ('Miami', 'FL'),
+    ('Minneapolis', 'MN'), ('Phoenix', 'AZ'),
+]
+
+name_words = [
+    'Blue', 'Velvet', 'Electric', 'Golden', 'Midnight', 'Silver', 'Wild',
+    'Broken', 'Crimson', 'Neon', 'Hollow', 'Lucky', 'Lonely', 'Northern',
+    'Rolling', 'Static', 'Paper', 'Iron', 'Copper', 'Echo',
+]
+venue_words = ['Hall', 'Room', 'Lounge', 'Club', 'Theatre', 'Tavern', 'Bar', 'Garden']
+artist_words = ['Band', 'Trio', 'Collective', 'Orchestra', 'Sound', 'Project', 'Quartet', 'Choir']
+
+genres = [value for value, label in genre_choices]
+
+
+def entity_row(rng, index, suffixes):
+    city, state = rng.choice(areas)
+    return {
+        'name': '%s %s %s %d' % (rng.choice(name_words), rng.choice(name_words), rng.choice(suffixes), index),
+        'city': city,
+        'state': state,
+        'phone': '%010d' % rng.randrange(10 ** 10),
+        'genres': rng.sample(genres, rng.randint(1, 3)),
+        'image_link': 'https://example.com/images/%d.jpg' % index,
+        'facebook_link': 'https://www.facebook.com/%d' % index,
+        'website': 'https://example.com/%d' % index,
+        'seeking_description': None,
+    }
+
+
+def venue_row(rng, index, upcoming=0):
+    row = entity_row(rng, index, venue_words)
+    row['num_upcoming_shows'] = upcoming
+    row['address'] = '%d %s St' % (rng.randint(1, 9999), rng.choice(name_words))
+    row['seeking_talent'] = rng.random() < 0.5
+    return row
+
+
+def artist_row(rng, index, upcoming=0):
+    row = entity_row(rng, index, artist_words)
+    row['num_upcoming_shows'] = upcoming
+    row['seeking_venue'] = rng.random() < 0.5
+    return row
+
+
+def show_row(rng, venues, artists, now):
+    return {
+        'venue_id': rng.randint(1, venues),
+        'artist_id': rng.randint(1, artists),
+        'start_time': now + timedelta(hours=rng.randint(-365 * 24, 365 * 24)),
+    }
+
+
+def insert(model, count, make_row, batch_size):
+    for start in range(0, count, batch_size):
+        insert_rows(model.__table__, [make_row(index) for index in range(start + 1, min(count, start + batch_size) + 1)])
+        db.session.commit()
+
+
+def seed(shows, venues=None, artists=None, batch_size=10000, random_seed=0):
+    '''Recreate the schema and fill it; returns the (venues, artists, shows) counts.'''
+    venues = venues or max(1, shows // 10)
+    artists = artists or max(1, shows // 10)
+    rng = random.Random(random_seed)
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+
+    db.session.remove()
+    db.drop_all()
+    if db.engine.dialect.name == 'postgresql':
+        # The 'sql' search backend ranks with pg_trgm's similarity().
+        db.session.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        db.session.commit()
+    db.create_all()
+
+    show_rng = random.Random(random_seed + 1)
+    upcoming_venues, upcoming_artists = Counter(), Counter()
+    for index in range(shows):
+        show = show_row(show_rng, venues, artists, now)
+        if show['start_time'] > now:
+            upcoming_venues[show['venue_id']] += 1
+            upcoming_artists[show['artist_id']] += 1
+
+    insert(Venue, venues, lambda index: venue_row(rng, index, upcoming_venues[index]), batch_size)
+    insert(Artist, artists, lambda index: artist_row(rng, index, upcoming_artists[index]), batch_size)
+    for model in (Venue, Artist):
+        sync_since(model, 0)
+    db.session.commit()
+    show_rng = random.Random(random_seed + 1)
+    insert(Show, shows, lambda index: show_row(show_rng, venues, artists, now), batch_size)
+    # Counted from `now` above, not from when create_all() started the watermark.
+    ShowCounterState.query.get(1).rolled_at = now
+    db.session.commit()
+    return venues, artists, shows
@@ -0,0 +1,158 @@
+from bisect import bisect_left, insort
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+from flask import current_app
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Double-booking checks.
+#----------------------------------------------------------------------------#
+
+# A show occupies its venue and its artist for [start_time, start_time +
+# duration). No show lasts longer than SHOW_MAX_DURATION minutes, so the only
+# shows that can overlap a new one start in (start - max duration, end): one
+# range scan of the (venue_id, start_time) and (artist_id, start_time)
+# indexes per show checked, whatever the size of the table. On Postgres an
+# exclusion constraint (see migrations) also catches concurrent bookings.
+
+CHUNK_SIZE = 100
+
+
+class Slot(object):
+    '''A show, existing or proposed, as the time it blocks.'''
+
+    def __init__(self, venue_id, artist_id, start, duration, show_id=None, venue_name=None, artist_name=None):
+        self.venue_id = venue_id
+        self.artist_id = artist_id
+        self.start = start
+        self.end = start + timedelta(minutes=duration)
+        self.duration = duration
+        self.show_id = show_id
+        self.venue_name = venue_name
+        self.artist_name = artist_name
+
+    def keys(self):
+        return (('venue', self.venue_id), ('artist', self.artist_id))
+
+    def describe(self):
+        # Slots not yet saved (earlier rows of an import) have no id or names.
+        description = '%s at %s, %s to %s' % (
+            self.artist_name or 'artist #%s' % self.artist_id, self.venue_name or 'venue #%s' % self.venue_id,
+            self.start.strftime('%Y-%m-%d %H:%M'), self.end.strftime('%Y-%m-%d %H:%M'))
+        if self.show_id is None:
+            return description
+        return 'show #%s: %s' % (self.show_id, description)
+
+
+class Conflict(ValueError):
+    def __init__(self, slot, existing):
+        self.slot = slot
+        self.existing = existing
+        what = 'venue' if existing.venue_id == slot.venue_id else 'artist'
+        ValueError.__init__(self, 'The %s is already booked then (%s).' % (what, existing.describe()))
+
+
+class Schedule(object):
+    '''Slots per venue and per artist, sorted by start time.'''
+
+    def __init__(self, max_duration):
+        self.max_duration = timedelta(minutes=max_duration)
+        self.slots = {}
+
+    def add(self, slot):
+        for key in slot.keys():
+            insort(self.slots.setdefault(key, []), (slot.start, id(slot), slot))
+
+    def conflict(self, slot):
+        '''The first slot overlapping `slot` at its venue or for its artist, or None.'''
+        for key in slot.keys():
+            slots = self.slots.get(key, [])
+            for index in range(bisect_left(slots, (slot.start - self.max_duration,)), len(slots)):
+                start, _, existing = slots[index]
+                if start >= slot.end:
+                    break
+                if existing.end > slot.start:
+                    return existing
+        return None
+
+
+def exclusion_violation(error):
+    '''Whether an IntegrityError came from the Postgres no-overlap constraints.'''
+    return getattr(error.orig, 'pgcode', None) == '23P01'
+
+
+def duration(minutes):
+    '''The duration of a new show in minutes: the default if blank, bounded by the maximum.'''
+    if minutes is None:
+        return current_app.config['SHOW_DEFAULT_DURATION']
+    maximum = current_app.config['SHOW_MAX_DURATION']
+    if not 0 < minutes <= maximum:
+        raise ValueError('A show lasts between 1 and %d minutes.' % maximum)
+    return minutes
+
+
+def occurrences(start, frequency, count=None, until=None):
+    '''Start times of a 'daily' or 'weekly' series: `count` shows, or up to the date `until`.'''
+    # Imported on first use, like the other dateutil helpers in app.py.
+    from dateutil import rrule
+    if (count is None) == (until is None):
+        raise ValueError('Give either a number of shows or an end date.')
+    if until is not None:
+        until = datetime.combine(until, time.max)
+    maximum = current_app.config['RECURRING_SHOWS_MAX']
+    rule = rrule.rrule({'daily': rrule.DAILY, 'weekly': rrule.WEEKLY}[frequency],
+                       dtstart=start, count=count, until=until)
+    starts = list(islice(rule, maximum + 1))
+    if len(starts) > maximum:
+        raise ValueError('A series has at most %d shows.' % maximum)
+    return starts
+
+
+def load_schedule(slots):
+    '''The existing shows that could overlap any of `slots`.'''
+    max_duration = current_app.config['SHOW_MAX_DURATION']
+    schedule = Schedule(max_duration)
+    slots = list(slots)
+    seen = set()
+    for chunk_start in range(0, len(slots), CHUNK_SIZE):
+        windows = []
+        for slot in slots[chunk_start:chunk_start + CHUNK_SIZE]:
+            earliest = slot.start - timedelta(minutes=max_duration)
+            for column, value in ((Show.venue_id, slot.venue_id), (Show.artist_id, slot.artist_id)):
+                windows.append(db.and_(column == value, Show.start_time > earliest, Show.start_time < slot.end))
+        rows = db.session.query(
+            Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.duration, Venue.name, Artist.name
+        ).join(Venue, Show.venue_id == Venue.id) \
+            .join(Artist, Show.artist_id == Artist.id) \
+            .filter(db.or_(*windows))
+        for show_id, venue_id, artist_id, start_time, minutes, venue_name, artist_name in rows:
+            if show_id not in seen:
+                seen.add(show_id)
+                schedule.add(Slot(venue_id, artist_id, start_time, minutes, show_id, venue_name, artist_name))
+    return schedule
+
+
+def check(slots):
+    '''Split `slots` into those that fit and (slot, Conflict) for those that do not.
+
+    Later slots are also checked against the earlier ones that fit.
+    '''
+    slots = list(slots)
+    schedule = load_schedule(slots)
+    accepted, conflicts = [], []
+    for slot in slots:
+        existing = schedule.conflict(slot)
+        if existing is None:
+            schedule.add(slot)
+            accepted.append(slot)
+        else:
+            conflicts.append((slot, Conflict(slot, existing)))
+    return accepted, conflicts
+
+
+def check_show(show):
+    '''Raise Conflict if `show` (not yet added) overlaps an existing show.'''
+    accepted, conflicts = check([Slot(int(show.venue_id), int(show.artist_id), show.start_time, show.duration)])
+    if conflicts:
+        raise conflicts[0][1]
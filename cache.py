@@ -0,0 +1,177 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, make_response, request, session
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#----------------------------------------------------------------------------#
+
+# Rendered GET pages are kept in a per-process LRU with a TTL. Each entry is
+# tagged with the venues and artists it shows ('venue:1', 'artist:4') plus
+# the listings it belongs to ('venues', 'artists', 'shows'); write routes
+# invalidate exactly the tags they touch. The TTL bounds staleness from
+# writes made by other processes (CLI jobs, other workers). With read
+# replicas a page can also be rendered from a replica that has not caught
+# up with a write yet, after that write's invalidation: it may then be stale
+# by the replica lag plus the TTL.
+
+VENUES = 'venues'
+ARTISTS = 'artists'
+SHOWS = 'shows'
+
+
+def venue_tag(venue_id):
+    return 'venue:%s' % venue_id
+
+
+def artist_tag(artist_id):
+    return 'artist:%s' % artist_id
+
+
+class CachedPage(object):
+    def __init__(self, body, status, headers, tags, expires):
+        self.body = body
+        self.status = status
+        self.headers = headers
+        self.tags = tags
+        self.expires = expires
+
+
+class PageCache(object):
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.keys_by_tag = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self.lock:
+            page = self.entries.get(key)
+            if page is not None and page.expires <= time.monotonic():
+                self._remove(key)
+                page = None
+            if page is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def set(self, key, body, status, headers, tags):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = CachedPage(body, status, headers, frozenset(tags), time.monotonic() + self.ttl)
+            for tag in tags:
+                self.keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self.lock:
+            for tag in tags:
+                for key in self.keys_by_tag.pop(tag, ()):
+                    if key in self.entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_tag.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _remove(self, key):
+        page = self.entries.pop(key)
+        for tag in page.tags:
+            keys = self.keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.keys_by_tag[tag]
+
+
+def init_app(app):
+    app.extensions['page_cache'] = PageCache(
+        app.config['PAGE_CACHE_MAX_ENTRIES'], app.config['PAGE_CACHE_TTL']
+    )
+
+
+def get_cache():
+    return current_app.extensions['page_cache']
+
+
+def tag(*tags):
+    '''Mark the page being rendered as depending on `tags`.'''
+    page_tags = g.get('page_cache_tags')
+    if page_tags is not None:
+        page_tags.update(tags)
+
+
+def invalidate(*tags):
+    get_cache().invalidate(*tags)
+
+
+def cached_page(view):
+    '''Serve a GET view from the page cache, keyed by endpoint and query args.'''
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # Pages with pending flash messages are personal; never share them.
+        if not current_app.config['PAGE_CACHE_ENABLED'] or session.get('_flashes'):
+            return view(*args, **kwargs)
+        page_cache = get_cache()
+        key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+        page = page_cache.get(key)
+        if page is not None:
+            return current_app.response_class(page.body, page.status, page.headers)
+
+        g.page_cache_tags = tags = set()
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            if response.is_streamed:
+                response.response = cached_stream(page_cache, key, response.response, response.charset,
+                                                  response.status, list(response.headers), tags)
+            else:
+                page_cache.set(key, response.get_data(), response.status, list(response.headers), tags)
+        return response
+    return wrapper
+
+
+def cached_stream(page_cache, key, body, charset, status, headers, tags):
+    '''Pass a streamed page through, caching it once it has been sent in full.
+
+    The status and headers are taken as the view returned them, before
+    after_request hooks (compress.py) adjust them for the encoded body.
+    '''
+    chunks = []
+    try:
+        for chunk in body:
+            chunks.append(chunk.encode(charset) if isinstance(chunk, str) else chunk)
+            yield chunk
+        # `tags` has been filled in while the page rendered.
+        page_cache.set(key, b''.join(chunks), status, headers, tags)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
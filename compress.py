@@ -0,0 +1,121 @@
+import zlib
+
+from flask import current_app, request
+
+# Browsers that accept br get brotli when the brotli package is installed,
+# gzip otherwise.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#----------------------------------------------------------------------------#
+# Response compression.
+#----------------------------------------------------------------------------#
+
+# Responses of a COMPRESS_MIMETYPES type (pages, JSON, the exports) are
+# compressed on the fly for browsers that accept it. Complete bodies are
+# compressed in one go once they reach COMPRESS_MIN_SIZE bytes; streamed
+# bodies chunk by chunk, flushed after every COMPRESS_FLUSH_SIZE bytes of
+# input so the browser gets the top of the page while the rest is rendered.
+# Files (static/, including the precompressed builds of assets.py), bodies
+# that already have a Content-Encoding and other types (images, fonts) are
+# sent as they are.
+
+
+class GzipCompressor(object):
+    def __init__(self, config):
+        self.compressor = zlib.compressobj(config['COMPRESS_LEVEL'], zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor(object):
+    def __init__(self, config):
+        self.compressor = brotli.Compressor(quality=config['COMPRESS_BROTLI_QUALITY'])
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+# Preferred first when the browser accepts both.
+compressors = [('gzip', GzipCompressor)]
+if brotli is not None:
+    compressors.insert(0, ('br', BrotliCompressor))
+
+
+def negotiate():
+    for encoding, compressor in compressors:
+        if request.accept_encodings[encoding]:
+            return encoding, compressor
+    return None, None
+
+
+def compressible(response):
+    return not (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or request.method == 'HEAD'
+                or response.direct_passthrough
+                or 'Content-Encoding' in response.headers
+                or 'no-transform' in response.headers.get('Cache-Control', '')
+                or response.mimetype not in current_app.config['COMPRESS_MIMETYPES'])
+
+
+def compressed_stream(body, charset, compressor, flush_size):
+    '''Compress the chunks of a streamed `body` as they are produced.'''
+    try:
+        pending = 0
+        for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= flush_size:
+                data += compressor.flush()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        # Replaces the body in the response, so it must close it (ending a
+        # stream_with_context context, releasing a cursor) in its place.
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def compress_response(response):
+    config = current_app.config
+    if not config['COMPRESS_ENABLED'] or not compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding, compressor = negotiate()
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compressed_stream(response.response, response.charset,
+                                              compressor(config), config['COMPRESS_FLUSH_SIZE'])
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        compressor = compressor(config)
+        response.set_data(compressor.compress(data) + compressor.finish())
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
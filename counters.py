@@ -0,0 +1,130 @@
+from collections import Counter
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from models import db, Venue, Artist, Show, ShowCounterState, show_foreign_keys
+import suggest
+
+#----------------------------------------------------------------------------#
+# Upcoming-show counters.
+#----------------------------------------------------------------------------#
+
+# Venue.num_upcoming_shows and Artist.num_upcoming_shows count the shows that
+# start after the watermark in show_counter_state. Writes keep them in step
+# inside their own transaction; `flask counters roll` moves the watermark up
+# to now, subtracting the shows that have started since the last roll. The
+# suggestions index re-reads the counters a commit changed.
+
+
+def watermark(lock=False):
+    query = ShowCounterState.query.filter(ShowCounterState.id == 1)
+    # Writers share the row; a roll holds it exclusively while it moves it.
+    state = query.with_for_update(read=not lock).one_or_none()
+    if state is None:
+        # Recounting here would count the shows the caller has just written
+        # a second time; the row comes with the schema instead.
+        raise RuntimeError('show_counter_state has no row; run `flask db upgrade` '
+                           'or `flask counters rebuild`.')
+    return state
+
+
+def adjust(model, delta, *criteria):
+    '''Add `delta` per show matching `criteria` to the counters of `model`.'''
+    foreign_key = show_foreign_keys[model]
+    shows = db.session.query(db.func.count(Show.id)) \
+        .filter(foreign_key == model.id, *criteria) \
+        .correlate(model.__table__) \
+        .as_scalar()
+    model.query.filter(model.id.in_(db.session.query(foreign_key).filter(*criteria))) \
+        .update({model.num_upcoming_shows: model.num_upcoming_shows + delta * shows}, synchronize_session=False)
+    suggest.record_counts(db.session(), model)
+
+
+def show_added(show):
+    if show.start_time > watermark().rolled_at:
+        for model, foreign_key in show_foreign_keys.items():
+            model.query.filter(model.id == getattr(show, foreign_key.key)) \
+                .update({model.num_upcoming_shows: model.num_upcoming_shows + 1}, synchronize_session=False)
+            suggest.record_counts(db.session(), model, [getattr(show, foreign_key.key)])
+
+
+def shows_added(shows):
+    '''Bulk `show_added` for dicts of show column values.'''
+    rolled_at = watermark().rolled_at
+    for model, foreign_key in show_foreign_keys.items():
+        added = Counter(show[foreign_key.key] for show in shows if show['start_time'] > rolled_at)
+        if added:
+            table = model.__table__
+            db.session.execute(
+                table.update()
+                    .where(table.c.id == db.bindparam('counted_id'))
+                    .values(num_upcoming_shows=table.c.num_upcoming_shows + db.bindparam('added')),
+                [{'counted_id': counted_id, 'added': count} for counted_id, count in added.items()]
+            )
+            suggest.record_counts(db.session(), model, list(added))
+
+
+def venue_deleted(venue_id):
+    '''Release the artists' counts for the venue's shows, before they go.'''
+    adjust(Artist, -1, Show.venue_id == venue_id, Show.start_time > watermark().rolled_at)
+
+
+def artist_deleted(artist_id):
+    '''Release the venues' counts for the artist's shows, before they go.'''
+    adjust(Venue, -1, Show.artist_id == artist_id, Show.start_time > watermark().rolled_at)
+
+
+def roll(now=None):
+    now = now or datetime.now()
+    state = watermark(lock=True)
+    if now > state.rolled_at:
+        for model in show_foreign_keys:
+            adjust(model, -1, Show.start_time > state.rolled_at, Show.start_time <= now)
+        state.rolled_at = now
+    return state
+
+
+def rebuild(now=None):
+    now = now or datetime.now()
+    for model, foreign_key in show_foreign_keys.items():
+        shows = db.session.query(db.func.count(Show.id)) \
+            .filter(foreign_key == model.id, Show.start_time > now) \
+            .correlate(model.__table__) \
+            .as_scalar()
+        model.query.update({model.num_upcoming_shows: shows}, synchronize_session=False)
+        suggest.record_counts(db.session(), model)
+    state = ShowCounterState.query.get(1)
+    if state is None:
+        state = ShowCounterState(id=1, rolled_at=now)
+        db.session.add(state)
+    state.rolled_at = now
+    db.session.flush()
+    return state
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+counters_cli = AppGroup('counters', help='Maintain the upcoming-show counters.')
+
+
+@counters_cli.command('roll')
+def roll_command():
+    '''Move shows that have started from upcoming to past.'''
+    state = roll()
+    db.session.commit()
+    click.echo('Upcoming-show counters rolled to %s' % state.rolled_at)
+
+
+@counters_cli.command('rebuild')
+def rebuild_command():
+    '''Recount every upcoming-show counter from the shows table.'''
+    state = rebuild()
+    db.session.commit()
+    click.echo('Upcoming-show counters rebuilt as of %s' % state.rolled_at)
+
+
+def init_app(app):
+    app.cli.add_command(counters_cli)
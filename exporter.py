@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Show catalogue export.
+#----------------------------------------------------------------------------#
+
+# Rows are read through a server-side cursor in batches of EXPORT_BATCH_SIZE
+# and encoded one at a time, so memory stays flat and the first line can be
+# sent before the whole table has been read.
+
+export_formats = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+export_columns = [
+    'id', 'start_time', 'duration',
+    'venue_id', 'venue_name', 'venue_city', 'venue_state',
+    'artist_id', 'artist_name',
+]
+
+
+def parse_bound(value):
+    '''Parse a --from/--to bound (ISO date or date and time); None if empty.'''
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+
+def export_rows(start=None, end=None):
+    '''Yield one dict per show starting in [start, end), by start time.'''
+    query = db.session.query(
+        Show.id, Show.start_time, Show.duration,
+        Venue.id.label('venue_id'), Venue.name.label('venue_name'),
+        Venue.city.label('venue_city'), Venue.state.label('venue_state'),
+        Artist.id.label('artist_id'), Artist.name.label('artist_name')
+    ).join(Venue, Show.venue_id == Venue.id) \
+        .join(Artist, Show.artist_id == Artist.id)
+    if start is not None:
+        query = query.filter(Show.start_time >= start)
+    if end is not None:
+        query = query.filter(Show.start_time < end)
+    query = query.order_by(Show.start_time, Show.id) \
+        .yield_per(current_app.config['EXPORT_BATCH_SIZE'])
+    for row in query:
+        yield dict(zip(export_columns, row))
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        row['start_time'] = row['start_time'].isoformat()
+        yield json.dumps(row) + '\n'
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, export_columns)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writeheader()
+    yield flush()
+    for row in rows:
+        row['start_time'] = row['start_time'].isoformat()
+        writer.writerow(row)
+        yield flush()
+
+
+encoders = {
+    'jsonl': jsonl_lines,
+    'csv': csv_lines,
+}
+
+
+def export_lines(format, start=None, end=None):
+    return encoders[format](export_rows(start, end))
+
+
+#----------------------------------------------------------------------------#
+# Command.
+#----------------------------------------------------------------------------#
+
+@click.command('export')
+@click.argument('output', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'format', type=click.Choice(sorted(export_formats)), default='jsonl')
+@click.option('--from', 'start', help='Only shows starting at or after this date/time (ISO 8601).')
+@click.option('--to', 'end', help='Only shows starting before this date/time (ISO 8601).')
+@with_appcontext
+def export_command(output, format, start, end):
+    '''Stream the show catalogue to OUTPUT (stdout by default).'''
+    try:
+        start, end = parse_bound(start), parse_bound(end)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    for line in export_lines(format, start, end):
+        output.write(line)
+
+
+def init_app(app):
+    app.cli.add_command(export_command)
@@ -0,0 +1,113 @@
+from flask import request
+from models import db, Venue, Artist, genre_tables
+from pagination import page_url
+
+#----------------------------------------------------------------------------#
+# Listing facets.
+#----------------------------------------------------------------------------#
+
+# /venues and /artists can be narrowed by genre, state and whether the
+# listing is seeking talent/venues (?genre=Jazz&state=CA&seeking=yes). Every
+# facet's value counts come from one UNION ALL query; each facet is counted
+# under the other facets' filters so that its values stay selectable.
+
+
+class Facet(object):
+    def __init__(self, name, label, model, value):
+        self.name = name
+        self.label = label
+        self.model = model
+        self.value = value
+
+    def source(self):
+        return self.model.__table__
+
+    def condition(self, value):
+        return self.value == value
+
+    def counts(self, conditions):
+        query = db.select([
+            db.literal(self.name).label('facet'),
+            self.value.label('value'),
+            db.func.count().label('count'),
+        ]).select_from(self.source())
+        if conditions:
+            query = query.where(db.and_(*conditions))
+        return query.group_by(self.value)
+
+
+class GenreFacet(Facet):
+    '''Counted and filtered through the genre association table (see genres.py).'''
+
+    def __init__(self, name, label, model):
+        self.table = genre_tables[model]
+        self.key = self.table.primary_key.columns.values()[0]
+        Facet.__init__(self, name, label, model, self.table.c.genre)
+
+    def source(self):
+        return self.table.join(self.model.__table__, self.key == self.model.id)
+
+    def condition(self, value):
+        return self.model.id.in_(db.select([self.key]).where(self.table.c.genre == value))
+
+
+def seeking(column):
+    return db.case([(column == db.true(), 'yes')], else_='no')
+
+
+facets = {
+    Venue: [
+        GenreFacet('genre', 'Genre', Venue),
+        Facet('state', 'State', Venue, Venue.state),
+        Facet('seeking', 'Seeking talent', Venue, seeking(Venue.seeking_talent)),
+    ],
+    Artist: [
+        GenreFacet('genre', 'Genre', Artist),
+        Facet('state', 'State', Artist, Artist.state),
+        Facet('seeking', 'Seeking venues', Artist, seeking(Artist.seeking_venue)),
+    ],
+}
+
+
+def active_filters(model):
+    '''{facet name: value} for the facets of `model` given in the query string.'''
+    return {facet.name: request.args[facet.name] for facet in facets[model] if request.args.get(facet.name)}
+
+
+def apply(query, model, filters):
+    for facet in facets[model]:
+        if facet.name in filters:
+            query = query.filter(facet.condition(filters[facet.name]))
+    return query
+
+
+def counts(model, filters):
+    '''{facet name: [(value, count)]}, most frequent first, in one query.'''
+    selects = []
+    for facet in facets[model]:
+        others = [other.condition(filters[other.name]) for other in facets[model]
+                  if other is not facet and other.name in filters]
+        selects.append(facet.counts(others))
+    values = {facet.name: [] for facet in facets[model]}
+    for name, value, count in db.session.execute(db.union_all(*selects)):
+        if value is not None:
+            values[name].append((value, count))
+    for facet_values in values.values():
+        facet_values.sort(key=lambda item: (-item[1], item[0]))
+    return values
+
+
+def sidebar(model, filters):
+    '''Facet payloads for pages/facets.html: values with counts and toggle links.'''
+    values = counts(model, filters)
+    return [{
+        'label': facet.label,
+        'active': filters.get(facet.name),
+        'clear_url': page_url(**{facet.name: None}),
+        'options': [{
+            'value': value,
+            'count': count,
+            'url': page_url(**{facet.name: value}),
+            'active': filters.get(facet.name) == value,
+        } for value, count in values[facet.name]],
+    } for facet in facets[model]]
@@ -0,0 +1,70 @@
+from sqlalchemy.orm import Session, attributes
+from models import db, genre_tables
+
+#----------------------------------------------------------------------------#
+# Genre association tables.
+#----------------------------------------------------------------------------#
+
+# The genres column stays the source of truth for forms and pages;
+# venue_genres and artist_genres copy it one row per genre so that filtering
+# and counting by genre use an index on every database. ORM writes are
+# mirrored at flush time; bulk inserts (flask import, the benchmark seed)
+# call `sync_since` after inserting.
+
+
+def listing_key(table):
+    return table.primary_key.columns.values()[0]
+
+
+def genre_rows(table, listing_id, genres):
+    key = listing_key(table).key
+    return [{key: listing_id, 'genre': genre} for genre in sorted(set(genres or ()))]
+
+
+def insert(connection, model, listing_id, genres):
+    table = genre_tables[model]
+    rows = genre_rows(table, listing_id, genres)
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+def replace(connection, model, listing_id, genres):
+    table = genre_tables[model]
+    connection.execute(table.delete().where(listing_key(table) == listing_id))
+    insert(connection, model, listing_id, genres)
+
+
+def sync_since(model, last_id):
+    '''Copy the genres of the `model` rows with ids above `last_id` that have none copied yet.'''
+    table = genre_tables[model]
+    key = listing_key(table)
+    listings = db.session.query(model.id, model.genres) \
+        .filter(model.id > last_id, ~db.exists().where(key == model.id))
+    rows = [row for listing_id, genres in listings for row in genre_rows(table, listing_id, genres)]
+    if rows:
+        db.session.execute(table.insert(), rows)
+
+
+def remove(model, listing_id):
+    '''Drop the copied genres of a listing removed with a bulk DELETE.'''
+    replace(db.session, model, listing_id, ())
+
+
+def last_id(model):
+    return db.session.query(db.func.max(model.id)).scalar() or 0
+
+
+def mirror_changes(session, flush_context):
+    connection = session.connection()
+    for obj in session.new:
+        if type(obj) in genre_tables:
+            insert(connection, type(obj), obj.id, obj.genres)
+    for obj in session.dirty:
+        if type(obj) in genre_tables and attributes.get_history(obj, 'genres').has_changes():
+            replace(connection, type(obj), obj.id, obj.genres)
+    for obj in session.deleted:
+        if type(obj) in genre_tables:
+            replace(connection, type(obj), obj.id, ())
+
+
+db.event.listen(Session, 'after_flush', mirror_changes)
@@ -0,0 +1,299 @@
+import csv
+import io
+import json
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import MultiDict
+
+import booking
+import counters
+import genres
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# Rows are streamed from the input, validated with the same forms as the
+# create pages, and written in batches of --batch-size rows per transaction
+# (COPY on Postgres, executemany elsewhere). Memory use is bounded by one
+# batch. Rejected rows are written to an error report and the load carries on.
+
+
+class ImportKind(object):
+    def __init__(self, model, form_class, columns, boolean_fields=()):
+        self.model = model
+        self.form_class = form_class
+        # Model column -> form field, as in the create_*_submission views.
+        self.columns = columns
+        self.boolean_fields = set(boolean_fields)
+
+    def validate(self, row):
+        form = self.form_class(formdata=form_data(row, self.boolean_fields), meta={'csrf': False})
+        if not form.validate():
+            return None, form.errors
+        return {column: getattr(form, field).data for column, field in self.columns.items()}, None
+
+
+kinds = {
+    'venues': ImportKind(Venue, VenueForm, {
+        'name': 'name',
+        'city': 'city',
+        'state': 'state',
+        'address': 'address',
+        'phone': 'phone',
+        'image_link': 'image_link',
+        'genres': 'genres',
+        'facebook_link': 'facebook_link',
+        'website': 'website_link',
+        'seeking_description': 'seeking_description',
+        'seeking_talent': 'seeking_talent',
+    }, boolean_fields=['seeking_talent']),
+    'artists': ImportKind(Artist, ArtistForm, {
+        'name': 'name',
+        'city': 'city',
+        'state': 'state',
+        'phone': 'phone',
+        'image_link': 'image_link',
+        'genres': 'genres',
+        'facebook_link': 'facebook_link',
+        'website': 'website_link',
+        'seeking_description': 'seeking_description',
+        'seeking_venue': 'seeking_venue',
+    }, boolean_fields=['seeking_venue']),
+    'shows': ImportKind(Show, ShowForm, {
+        'artist_id': 'artist_id',
+        'venue_id': 'venue_id',
+        'start_time': 'start_time',
+        'duration': 'duration',
+    }),
+}
+
+false_values = ('', '0', 'f', 'false', 'n', 'no', 'off')
+
+
+def form_data(row, boolean_fields):
+    data = MultiDict()
+    for key, value in row.items():
+        if value is None:
+            continue
+        if key in boolean_fields:
+            if str(value).strip().lower() not in false_values:
+                data.add(key, 'y')
+        elif isinstance(value, list):
+            for item in value:
+                data.add(key, str(item))
+        elif key == 'genres':
+            for item in str(value).split(','):
+                if item.strip():
+                    data.add(key, item.strip())
+        else:
+            data.add(key, str(value))
+    return data
+
+
+def read_rows(stream, format):
+    '''Yield (line number, row dict or None, error) for each input record.'''
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, str(e)
+            continue
+        if isinstance(row, dict):
+            yield line_number, row, None
+        else:
+            yield line_number, None, 'expected a JSON object'
+
+
+#----------------------------------------------------------------------------#
+# Writing.
+#----------------------------------------------------------------------------#
+
+def copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        return '{' + ','.join(
+            '"%s"' % str(item).replace('\\', '\\\\').replace('"', '\\"') for item in value
+        ) + '}'
+    return value
+
+
+def insert_rows(table, rows):
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        connection.execute(table.insert(), rows)
+        return
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([copy_value(row[column]) for column in columns])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    cursor.copy_expert(
+        'COPY "%s" (%s) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'
+        % (table.name, ', '.join('"%s"' % column for column in columns)),
+        buffer
+    )
+
+
+def check_show_bookings(batch):
+    '''Split show rows into those that fit the schedule and those that double-book.
+
+    Rows are checked against existing shows and against earlier rows of the batch.
+    '''
+    slots = [booking.Slot(values['venue_id'], values['artist_id'], values['start_time'], values['duration'])
+             for line_number, row, values in batch]
+    fits, conflicts = booking.check(slots)
+    conflicting = {id(slot): conflict for slot, conflict in conflicts}
+    accepted, rejected = [], []
+    for slot, (line_number, row, values) in zip(slots, batch):
+        conflict = conflicting.get(id(slot))
+        if conflict is None:
+            accepted.append((line_number, row, values))
+        else:
+            rejected.append((line_number, row, values, {'start_time': [str(conflict)]}))
+    return accepted, rejected
+
+
+def check_show_references(batch):
+    '''Split show rows into those whose venue and artist exist and the rest.'''
+    known = {}
+    for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        ids = {values[key] for line_number, row, values in batch}
+        known[key] = {row_id for row_id, in db.session.query(model.id).filter(model.id.in_(ids))}
+    accepted, rejected = [], []
+    for line_number, row, values in batch:
+        errors = {key: ['No %s with id %s' % (key[:-3], values[key])]
+                  for key in ('venue_id', 'artist_id') if values[key] not in known[key]}
+        (rejected if errors else accepted).append((line_number, row, values, errors))
+    return accepted, rejected
+
+
+class ImportReport(object):
+    def __init__(self, errors_file):
+        self.errors_file = errors_file
+        self.imported = 0
+        self.rejected = 0
+
+    def reject(self, line_number, row, errors):
+        self.rejected += 1
+        self.errors_file.write(json.dumps({'line': line_number, 'errors': errors, 'row': row}, default=str) + '\n')
+
+
+def load_batch(kind, batch, report):
+    if kind.model is Show:
+        accepted, rejected = check_show_references(batch)
+        for line_number, row, values, errors in rejected:
+            report.reject(line_number, row, errors)
+        batch, rejected = check_show_bookings(
+            [(line_number, row, values) for line_number, row, values, errors in accepted])
+        for line_number, row, values, errors in rejected:
+            report.reject(line_number, row, errors)
+    if not batch:
+        return
+    rows = [values for line_number, row, values in batch]
+    try:
+        if kind.model is Show:
+            insert_rows(kind.model.__table__, rows)
+            counters.shows_added(rows)
+        else:
+            last_id = genres.last_id(kind.model)
+            insert_rows(kind.model.__table__, rows)
+            genres.sync_since(kind.model, last_id)
+        db.session.commit()
+    except DBAPIError as e:
+        error = str(e.orig)
+    except db.engine.dialect.dbapi.Error as e:
+        # COPY goes through the raw driver cursor.
+        error = str(e)
+    else:
+        report.imported += len(rows)
+        return
+    db.session.rollback()
+    for line_number, row, values in batch:
+        report.reject(line_number, row, {'batch': [error.strip()]})
+
+
+def run_import(kind, stream, format, batch_size, report):
+    batch = []
+    for line_number, row, error in read_rows(stream, format):
+        if row is None:
+            report.reject(line_number, None, {'row': [error]})
+            continue
+        values, errors = kind.validate(row)
+        if errors:
+            report.reject(line_number, row, errors)
+            continue
+        if kind.model is Show:
+            try:
+                values['venue_id'] = int(values['venue_id'])
+                values['artist_id'] = int(values['artist_id'])
+            except (TypeError, ValueError):
+                report.reject(line_number, row, {'id': ['venue_id and artist_id must be integers']})
+                continue
+            try:
+                values['duration'] = booking.duration(values['duration'])
+            except ValueError as e:
+                report.reject(line_number, row, {'duration': [str(e)]})
+                continue
+        batch.append((line_number, row, values))
+        if len(batch) >= batch_size:
+            load_batch(kind, batch, report)
+            batch = []
+    load_batch(kind, batch, report)
+
+
+#----------------------------------------------------------------------------#
+# Command.
+#----------------------------------------------------------------------------#
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(kinds)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']),
+              help='Input format; defaults to the file extension.')
+@click.option('--batch-size', type=int, help='Rows per transaction.')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+              help='Where to write rejected rows (JSON lines).')
+@with_appcontext
+def import_command(kind, source, format, batch_size, errors_path):
+    '''Bulk load venues, artists or shows from a CSV or JSONL file.'''
+    if format is None:
+        extension = os.path.splitext(source.name)[1].lower()
+        if extension not in ('.csv', '.jsonl'):
+            raise click.UsageError('Cannot tell the format of %s; pass --format.' % source.name)
+        format = extension[1:]
+    batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+    if errors_path is None:
+        errors_path = (source.name if source.name != '<stdin>' else kind) + '.errors.jsonl'
+
+    with open(errors_path, 'w', encoding='utf-8') as errors_file:
+        report = ImportReport(errors_file)
+        run_import(kinds[kind], source, format, batch_size, report)
+
+    click.echo('Imported %d %s.' % (report.imported, kind))
+    if report.rejected:
+        click.echo('Rejected %d rows; see %s.' % (report.rejected, errors_path))
+    else:
+        os.remove(errors_path)
+
+
+def init_app(app):
+    app.cli.add_command(import_command)
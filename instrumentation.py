@@ -0,0 +1,131 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime
+
+from flask import g, has_request_context, request, request_started, request_finished, \
+    before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Request instrumentation.
+#----------------------------------------------------------------------------#
+
+# A sampled request gets a RequestMetrics in `g`. Cursor events add each
+# statement's time to it and template signals add render time; when the
+# response is closed (after the last byte of a streamed body) one JSON line is
+# appended to REQUEST_LOG_PATH.
+
+
+class RequestMetrics(object):
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_started = []
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+
+    def statement(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        if self.slowest_statement is None or elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_statement = statement
+
+    def record(self, method, route, endpoint, status):
+        return {
+            'time': datetime.utcnow().isoformat() + 'Z',
+            'method': method,
+            'route': route,
+            'endpoint': endpoint,
+            'status': status,
+            'wall_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 3),
+            'render_ms': round(self.render_time * 1000, 3),
+            'slowest_statement': self.slowest_statement and {
+                'ms': round(self.slowest_time * 1000, 3),
+                'sql': self.slowest_statement,
+            },
+        }
+
+
+log_lock = threading.Lock()
+
+
+def write_record(path, record):
+    line = json.dumps(record) + '\n'
+    with log_lock:
+        with open(path, 'a', encoding='utf-8') as log:
+            log.write(line)
+
+
+def current_metrics():
+    if has_request_context():
+        return g.get('request_metrics')
+    return None
+
+
+#----------------------------------------------------------------------------#
+# SQLAlchemy events.
+#----------------------------------------------------------------------------#
+
+# Registered on the Engine class so every engine the app creates is covered.
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_metrics() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics = current_metrics()
+    started = conn.info.get('query_started')
+    if metrics is not None and started:
+        metrics.statement(statement, time.perf_counter() - started.pop())
+
+
+#----------------------------------------------------------------------------#
+# Flask signals.
+#----------------------------------------------------------------------------#
+
+def on_request_started(app, **extra):
+    rate = app.config['REQUEST_LOG_SAMPLE_RATE']
+    if rate > 0 and (rate >= 1 or random.random() < rate):
+        g.request_metrics = RequestMetrics()
+
+
+def on_before_render_template(app, template, context, **extra):
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.render_started.append(time.perf_counter())
+
+
+def on_template_rendered(app, template, context, **extra):
+    metrics = current_metrics()
+    if metrics is not None and metrics.render_started:
+        metrics.render_time += time.perf_counter() - metrics.render_started.pop()
+
+
+def on_request_finished(app, response, **extra):
+    metrics = current_metrics()
+    if metrics is None:
+        return
+    path = app.config['REQUEST_LOG_PATH']
+    method = request.method
+    route = request.url_rule.rule if request.url_rule is not None else request.path
+    endpoint = request.endpoint
+    status = response.status_code
+    response.call_on_close(lambda: write_record(path, metrics.record(method, route, endpoint, status)))
+
+
+def init_app(app):
+    request_started.connect(on_request_started, app)
+    before_render_template.connect(on_before_render_template, app)
+    template_rendered.connect(on_template_rendered, app)
+    request_finished.connect(on_request_finished, app)
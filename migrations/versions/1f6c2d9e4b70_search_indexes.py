@@ -0,0 +1,40 @@
+"""search indexes
+
+Revision ID: 1f6c2d9e4b70
+Revises: 74a03a65a85a
+Create Date: 2026-10-18 06:40:12.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f6c2d9e4b70'
+down_revision = '74a03a65a85a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Trigram and array indexes only exist on Postgres; other databases fall
+    # back to the in-process search index.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        for column in ('name', 'city'):
+            op.create_index(
+                'ix_%s_%s_trgm' % (table, column), table, [column],
+                postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}
+            )
+        op.create_index('ix_%s_genres' % table, table, ['genres'], postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in ('Venue', 'Artist'):
+        op.drop_index('ix_%s_genres' % table, table_name=table)
+        for column in ('name', 'city'):
+            op.drop_index('ix_%s_%s_trgm' % (table, column), table_name=table)
@@ -0,0 +1,27 @@
+"""venue area order
+
+Revision ID: 3a9d5e7c2b14
+Revises: f6a3c92e1d58
+Create Date: 2026-10-18 21:05:31.482913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9d5e7c2b14'
+down_revision = 'f6a3c92e1d58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keyset order of the venues page; it also covers what (state, city) did.
+    op.create_index('ix_Venue_state_city_name_id', 'Venue', ['state', 'city', 'name', 'id'])
+    op.drop_index('ix_Venue_state_city', table_name='Venue')
+
+
+def downgrade():
+    op.create_index('ix_Venue_state_city', 'Venue', ['state', 'city'])
+    op.drop_index('ix_Venue_state_city_name_id', table_name='Venue')
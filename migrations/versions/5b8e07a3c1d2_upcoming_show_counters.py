@@ -0,0 +1,43 @@
+"""upcoming show counters
+
+Revision ID: 5b8e07a3c1d2
+Revises: 1f6c2d9e4b70
+Create Date: 2026-10-18 07:25:41.902337
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e07a3c1d2'
+down_revision = '1f6c2d9e4b70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artist', sa.Column('num_upcoming_shows', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('show_counter_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Backfill the counters as of now and start the watermark there.
+    now = datetime.now()
+    for table, column in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.execute(sa.text(
+            'UPDATE "{0}" SET num_upcoming_shows = '
+            '(SELECT count(*) FROM shows WHERE shows.{1} = "{0}".id AND shows.start_time > :now)'.format(table, column)
+        ).bindparams(now=now))
+    op.execute(sa.text('INSERT INTO show_counter_state (id, rolled_at) VALUES (1, :now)').bindparams(now=now))
+
+
+def downgrade():
+    op.drop_table('show_counter_state')
+    op.drop_column('Artist', 'num_upcoming_shows')
+    op.drop_column('Venue', 'num_upcoming_shows')
@@ -0,0 +1,44 @@
+"""listing sort keys not null
+
+Revision ID: 8b2f4d6a1c39
+Revises: 3a9d5e7c2b14
+Create Date: 2026-10-18 23:12:47.306518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2f4d6a1c39'
+down_revision = '3a9d5e7c2b14'
+branch_labels = None
+depends_on = None
+
+
+# Keyset pagination compares (state, city, name, id) tuples, which skip or
+# repeat rows holding a NULL; the forms and the importer always set these.
+sort_columns = (
+    ('Venue', 'name', sa.String()),
+    ('Venue', 'city', sa.String(length=120)),
+    ('Venue', 'state', sa.String(length=120)),
+    ('Artist', 'name', sa.String()),
+)
+
+
+def upgrade():
+    for table, column, type_ in sort_columns:
+        op.execute('UPDATE "%s" SET %s = \'\' WHERE %s IS NULL' % (table, column, column))
+    # SQLite cannot alter a column in place; its rows are filled in above
+    # and the application never writes a NULL.
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    for table, column, type_ in sort_columns:
+        op.alter_column(table, column, existing_type=type_, nullable=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    for table, column, type_ in sort_columns:
+        op.alter_column(table, column, existing_type=type_, nullable=True)
@@ -0,0 +1,44 @@
+"""hot path indexes
+
+Revision ID: 9d41f6b2a8e3
+Revises: 5b8e07a3c1d2
+Create Date: 2026-10-18 09:12:47.306118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d41f6b2a8e3'
+down_revision = '5b8e07a3c1d2'
+branch_labels = None
+depends_on = None
+
+
+def lower_name(bind):
+    # text_pattern_ops lets Postgres serve LIKE 'prefix%' whatever the collation.
+    if bind.dialect.name == 'postgresql':
+        return sa.text('lower(name) text_pattern_ops')
+    return sa.text('lower(name)')
+
+
+def upgrade():
+    bind = op.get_bind()
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'])
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'])
+    op.create_index('ix_shows_start_time_id', 'shows', ['start_time', 'id'])
+    op.create_index('ix_Venue_state_city', 'Venue', ['state', 'city'])
+    for table in ('Venue', 'Artist'):
+        op.create_index('ix_%s_name_id' % table, table, ['name', 'id'])
+        op.create_index('ix_%s_lower_name' % table, table, [lower_name(bind)])
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_index('ix_%s_lower_name' % table, table_name=table)
+        op.drop_index('ix_%s_name_id' % table, table_name=table)
+    op.drop_index('ix_Venue_state_city', table_name='Venue')
+    op.drop_index('ix_shows_start_time_id', table_name='shows')
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
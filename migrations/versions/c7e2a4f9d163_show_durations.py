@@ -0,0 +1,40 @@
+"""show durations
+
+Revision ID: c7e2a4f9d163
+Revises: 9d41f6b2a8e3
+Create Date: 2026-10-18 14:05:21.518904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2a4f9d163'
+down_revision = '9d41f6b2a8e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('duration', sa.Integer(), server_default='120', nullable=False))
+    # The application checks for overlaps before inserting (booking.py); on
+    # Postgres the database also rejects concurrent double bookings. Existing
+    # overlapping shows must be moved or removed before this constraint can
+    # be created.
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for column in ('venue_id', 'artist_id'):
+        op.execute(
+            'ALTER TABLE shows ADD CONSTRAINT shows_%s_no_overlap EXCLUDE USING gist '
+            "(%s WITH =, tsrange(start_time, start_time + duration * interval '1 minute') WITH &&)"
+            % (column, column)
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for column in ('venue_id', 'artist_id'):
+            op.execute('ALTER TABLE shows DROP CONSTRAINT shows_%s_no_overlap' % column)
+    op.drop_column('shows', 'duration')
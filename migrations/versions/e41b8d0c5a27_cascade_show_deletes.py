@@ -0,0 +1,39 @@
+"""cascade show deletes
+
+Revision ID: e41b8d0c5a27
+Revises: c7e2a4f9d163
+Create Date: 2026-10-18 16:40:09.227351
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41b8d0c5a27'
+down_revision = 'c7e2a4f9d163'
+branch_labels = None
+depends_on = None
+
+foreign_keys = (
+    ('shows_venue_id_fkey', 'Venue', 'venue_id'),
+    ('shows_artist_id_fkey', 'Artist', 'artist_id'),
+)
+
+
+def replace_foreign_keys(ondelete):
+    # SQLite cannot alter constraints in place (and does not enforce them
+    # unless asked); the application deletes the shows itself anyway.
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    for name, table, column in foreign_keys:
+        op.drop_constraint(name, 'shows', type_='foreignkey')
+        op.create_foreign_key(name, 'shows', table, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
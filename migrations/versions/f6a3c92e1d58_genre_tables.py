@@ -0,0 +1,47 @@
+"""genre tables
+
+Revision ID: f6a3c92e1d58
+Revises: e41b8d0c5a27
+Create Date: 2026-10-18 18:22:51.904316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6a3c92e1d58'
+down_revision = 'e41b8d0c5a27'
+branch_labels = None
+depends_on = None
+
+genre_tables = (
+    ('venue_genres', 'Venue', 'venue_id'),
+    ('artist_genres', 'Artist', 'artist_id'),
+)
+
+
+def genre_values(bind, table):
+    # Postgres stores genres as an array, SQLite as JSON.
+    if bind.dialect.name == 'postgresql':
+        return 'SELECT DISTINCT id, unnest(genres) FROM "%s"' % table
+    return 'SELECT DISTINCT "%s".id, genre.value FROM "%s", json_each("%s".genres) AS genre' % (table, table, table)
+
+
+def upgrade():
+    bind = op.get_bind()
+    for name, table, key in genre_tables:
+        op.create_table(name,
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('genre', sa.String(length=120), nullable=False),
+        sa.ForeignKeyConstraint([key], ['%s.id' % table], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(key, 'genre')
+        )
+        op.create_index('ix_%s_genre' % name, name, ['genre', key])
+        op.execute('INSERT INTO %s (%s, genre) %s' % (name, key, genre_values(bind, table)))
+
+
+def downgrade():
+    for name, table, key in genre_tables:
+        op.drop_index('ix_%s_genre' % name, table_name=name)
+        op.drop_table(name)
@@ -1,7 +1,22 @@
-from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from replicas import RoutingSQLAlchemy
 
-db = SQLAlchemy()
+# Routes GET requests to the read replicas, if any are configured.
+db = RoutingSQLAlchemy()
+
+# Postgres stores genres as a native array; SQLite (local runs) as JSON.
+genre_list = db.ARRAY(db.String).with_variant(db.JSON, 'sqlite')
+
+
+def listing_indexes(table, name):
+    '''Indexes shared by Venue and Artist: listing order and name prefixes.'''
+    return (
+        # Keyset pagination of the listings orders by (name, id).
+        db.Index('ix_%s_name_id' % table, name, 'id'),
+        # Case-insensitive name prefix matches (lower(name) LIKE 'term%').
+        db.Index('ix_%s_lower_name' % table, db.func.lower(name).label('lower_name'),
+                 postgresql_ops={'lower_name': 'text_pattern_ops'}),
+    )
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -11,39 +26,103 @@ class Venue(db.Model):
     __tablename__ = 'Venue'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
+    # name, city and state are keyset pagination keys: never NULL.
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String), nullable=False)
+    genres = db.Column(genre_list, nullable=False)
     facebook_link = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(120))
-    shows = db.relationship('Show', backref='venue', lazy='dynamic')
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    shows = db.relationship('Show', backref='venue', lazy='dynamic', passive_deletes=True)
+    # Plain collection of the same shows, so detail pages can joinedload them.
+    show_list = db.relationship('Show', viewonly=True, order_by='Show.start_time')
+
+    __table_args__ = listing_indexes('Venue', name) + (
+        # The venues page lists them by area, keyset paginated.
+        db.Index('ix_Venue_state_city_name_id', 'state', 'city', 'name', 'id'),
+    )
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String), nullable=False)
+    genres = db.Column(genre_list, nullable=False)
     facebook_link = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(120))
-    shows = db.relationship('Show', backref='artist', lazy='dynamic')
+    num_upcoming_shows = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    shows = db.relationship('Show', backref='artist', lazy='dynamic', passive_deletes=True)
+    show_list = db.relationship('Show', viewonly=True, order_by='Show.start_time')
+
+    __table_args__ = listing_indexes('Artist', name)
 
 class Show(db.Model):
     __tablename__ = 'shows'
 
     id = db.Column(db.Integer, primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
-    start_time = db.Column(db.DateTime, default=datetime.now(), nullable=False)
\ No newline at end of file
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, default=datetime.now(), nullable=False)
+    # Minutes; see booking.py. On Postgres an exclusion constraint (added by
+    # migration, as it needs btree_gist) forbids overlapping shows.
+    duration = db.Column(db.Integer, nullable=False, default=120, server_default='120')
+
+    __table_args__ = (
+        # A venue's or artist's shows in date order (detail pages, counters).
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        # /shows and the export page through shows by (start_time, id); the
+        # counter roll scans a start_time range.
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+    )
+
+# The Show column referencing each side of a booking.
+show_foreign_keys = {
+    Venue: Show.venue_id,
+    Artist: Show.artist_id,
+}
+
+
+def genre_table(name, table):
+    '''One row per (listing, genre), mirroring the genres column; see genres.py.'''
+    key = name[:-len('_genres')] + '_id'
+    return db.Table(
+        name,
+        db.Column(key, db.Integer, db.ForeignKey('%s.id' % table, ondelete='CASCADE'), primary_key=True),
+        db.Column('genre', db.String(120), primary_key=True),
+        # Filtering by genre and counting per genre.
+        db.Index('ix_%s_genre' % name, 'genre', key),
+    )
+
+venue_genres = genre_table('venue_genres', 'Venue')
+artist_genres = genre_table('artist_genres', 'Artist')
+
+genre_tables = {
+    Venue: venue_genres,
+    Artist: artist_genres,
+}
+
+class ShowCounterState(db.Model):
+    __tablename__ = 'show_counter_state'
+
+    # Single row: num_upcoming_shows counts the shows starting after rolled_at.
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_at = db.Column(db.DateTime, nullable=False)
+
+
+@db.event.listens_for(ShowCounterState.__table__, 'after_create')
+def insert_counter_state(table, connection, **kw):
+    '''create_all() starts the watermark too: a new schema has no shows to count.'''
+    connection.execute(table.insert().values(id=1, rolled_at=datetime.now()))
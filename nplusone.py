@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request, request_started
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# N+1 query detection.
+#----------------------------------------------------------------------------#
+
+# With NPLUSONE_ENABLED every statement a request runs is fingerprinted (its
+# SQL with whitespace and IN-list lengths normalized; parameters are never
+# part of it). When one fingerprint runs more than NPLUSONE_THRESHOLD times,
+# which is what a lazy load or a query inside a loop looks like, the view,
+# the template line and the application line issuing it are logged as a
+# warning, or raised as NPlusOneError when the app is TESTING so that tests
+# and benchmark runs fail.
+
+
+class NPlusOneError(RuntimeError):
+    pass
+
+
+# A parenthesized list of bind placeholders in any paramstyle:
+# (?, ?), (%(id_1)s, %(id_2)s), (:id_1, :id_2), (%s, %s).
+PLACEHOLDER = r'\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*'
+PLACEHOLDER_LIST = re.compile(r'\((?:%s,)*%s\)' % (PLACEHOLDER, PLACEHOLDER))
+
+
+def fingerprint(statement):
+    return PLACEHOLDER_LIST.sub('(?)', ' '.join(statement.split()))
+
+
+def culprit(root_path):
+    '''(template line, application line) of the statement being executed, innermost first.'''
+    template_line = code_line = None
+    frame = sys._getframe(1)
+    while frame is not None and (template_line is None or code_line is None):
+        template = frame.f_globals.get('__jinja_template__')
+        filename = frame.f_code.co_filename
+        if template is not None:
+            if template_line is None:
+                template_line = '%s line %d' % (template.name or '<string>', template.get_corresponding_lineno(frame.f_lineno))
+        elif code_line is None and filename.startswith(root_path) and filename != __file__ \
+                and 'site-packages' not in filename:
+            code_line = '%s:%d in %s' % (os.path.relpath(filename, root_path), frame.f_lineno, frame.f_code.co_name)
+        frame = frame.f_back
+    return template_line, code_line
+
+
+def report(shape, count):
+    template_line, code_line = culprit(current_app.root_path)
+    return 'N+1 queries in view %s (%s, %s): %d runs of %s' % (
+        request.endpoint, template_line or 'no template', code_line or 'no application frame', count,
+        shape if len(shape) <= 300 else shape[:300] + '...')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    shapes = g.get('statement_shapes') if has_request_context() else None
+    if shapes is None:
+        return
+    shape = fingerprint(statement)
+    shapes[shape] += 1
+    # Reported once per shape, on the run that crosses the threshold.
+    if shapes[shape] == current_app.config['NPLUSONE_THRESHOLD'] + 1:
+        message = report(shape, shapes[shape])
+        if current_app.testing:
+            raise NPlusOneError(message)
+        current_app.logger.warning(message)
+
+
+def on_request_started(app, **extra):
+    if app.config['NPLUSONE_ENABLED']:
+        g.statement_shapes = Counter()
+
+
+def init_app(app):
+    request_started.connect(on_request_started, app)
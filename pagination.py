@@ -0,0 +1,141 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import abort, current_app, request, url_for
+from models import db
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+
+# Pages are addressed by the sort key of the row they start after (or end
+# before) instead of an OFFSET, so the database seeks straight to the page
+# through the ordering index no matter how deep the page is. Row value
+# comparisons skip rows with a NULL in the key, so sort columns are NOT NULL
+# and a cursor holding a null is rejected.
+
+
+def encode_cursor(values):
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(columns) or None in values:
+            raise ValueError(cursor)
+        return tuple(
+            datetime.fromisoformat(value) if isinstance(column.type, db.DateTime) else value
+            for column, value in zip(columns, values)
+        )
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        abort(400)
+
+
+class Page(object):
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class StreamedPage(Page):
+    '''A forward page whose rows are fetched `batch_size` at a time as it is iterated.
+
+    Its cursors are only known once the rows have been read, so templates
+    render the pager after them; iterating again queries again.
+    '''
+
+    def __init__(self, query, key, per_page, has_prev, batch_size):
+        Page.__init__(self, None)
+        self.query = query
+        self.key = key
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.batch_size = batch_size
+
+    def __iter__(self):
+        first = last = None
+        for count, row in enumerate(self.query.limit(self.per_page + 1).yield_per(self.batch_size)):
+            if count == self.per_page:
+                self.next_cursor = encode_cursor(self.key(last))
+                break
+            if first is None:
+                first = row
+            last = row
+            yield row
+        if first is not None and self.has_prev:
+            self.prev_cursor = encode_cursor(self.key(first))
+
+
+def keyset_paginate(query, columns, key, per_page=None, after=None, before=None):
+    '''Return one `Page` of `query` ordered by `columns`.
+
+    `columns` must make a unique ordering (end it with the primary key) and
+    `key(row)` must return the values of `columns` for a result row.
+    '''
+    per_page = per_page or current_app.config['PAGE_SIZE']
+    position = db.tuple_(*columns)
+    if before is not None:
+        query = query.filter(position < decode_cursor(before, columns)) \
+            .order_by(*[column.desc() for column in columns])
+    else:
+        if after is not None:
+            query = query.filter(position > decode_cursor(after, columns))
+        query = query.order_by(*columns)
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before is not None:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+
+    next_cursor = encode_cursor(key(rows[-1])) if rows and has_next else None
+    prev_cursor = encode_cursor(key(rows[0])) if rows and has_prev else None
+    return Page(rows, next_cursor, prev_cursor)
+
+
+def keyset_stream(query, columns, key, per_page=None, after=None, batch_size=None):
+    '''Like `keyset_paginate` without `before`, but returns a `StreamedPage`.'''
+    per_page = per_page or current_app.config['PAGE_SIZE']
+    if after is not None:
+        query = query.filter(db.tuple_(*columns) > decode_cursor(after, columns))
+    return StreamedPage(query.order_by(*columns), key, per_page, after is not None,
+                        batch_size or current_app.config['LISTING_BATCH_SIZE'])
+
+
+def paginate_request(query, columns, key, stream=False):
+    '''`keyset_paginate` driven by the `after`/`before`/`per_page` query args.
+
+    With `stream` forward pages are read lazily (see `StreamedPage`); pages
+    before a cursor are read backwards and flipped, so they are read whole.
+    '''
+    per_page = request.args.get('per_page', type=int) or current_app.config['PAGE_SIZE']
+    per_page = max(1, min(per_page, current_app.config['MAX_PAGE_SIZE']))
+    before = request.args.get('before')
+    if stream and before is None:
+        return keyset_stream(query, columns, key, per_page=per_page, after=request.args.get('after'))
+    return keyset_paginate(query, columns, key, per_page=per_page, after=request.args.get('after'), before=before)
+
+
+def page_url(**cursor):
+    '''URL of the current listing with its cursor replaced by `cursor`.'''
+    args = request.args.to_dict()
+    args.pop('after', None)
+    args.pop('before', None)
+    args.update(cursor)
+    return url_for(request.endpoint, **dict(request.view_args or {}, **args))
@@ -0,0 +1,214 @@
+from collections import OrderedDict
+from datetime import datetime
+
+from models import db, Venue, Artist, Show
+from pagination import paginate_request
+
+#----------------------------------------------------------------------------#
+# Payloads.
+#----------------------------------------------------------------------------#
+
+# Shared by the HTML views and the JSON API, so both serialize venues,
+# artists and shows the same way. A Resource selects only the columns for the
+# requested fields (joining the venue/artist only when one of their fields is
+# asked for) and pages on its sort key.
+
+
+class Resource(object):
+    def __init__(self, model, fields, sort, joins=None):
+        self.model = model
+        self.fields = fields
+        self.sort = sort
+        self.joins = joins or {}
+
+    def parse_fields(self, value, default):
+        if not value:
+            return list(default)
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in self.fields]
+        if unknown or not fields:
+            raise ValueError('Unknown fields: %s' % ', '.join(unknown))
+        return fields
+
+    def select(self, fields):
+        columns = [self.fields[field].label(field) for field in fields]
+        # The sort key is always selected so that cursors can be built.
+        columns += [column.label('sort_%d' % i) for i, column in enumerate(self.sort)]
+        query = db.session.query(*columns).select_from(self.model)
+        for target, onclause in self.joins.items():
+            if any(self.fields[field].class_ is target for field in fields):
+                query = query.join(target, onclause)
+        return query
+
+    def sort_key(self, row):
+        return tuple(getattr(row, 'sort_%d' % i) for i in range(len(self.sort)))
+
+    def row_id(self, row):
+        # Every sort key ends with the primary key.
+        return getattr(row, 'sort_%d' % (len(self.sort) - 1))
+
+    def paginate(self, query, stream=False):
+        return paginate_request(query, self.sort, self.sort_key, stream)
+
+    def payload(self, row, fields):
+        return {field: getattr(row, field) for field in fields}
+
+
+venues = Resource(Venue, OrderedDict([
+    ('id', Venue.id),
+    ('name', Venue.name),
+    ('genres', Venue.genres),
+    ('address', Venue.address),
+    ('city', Venue.city),
+    ('state', Venue.state),
+    ('phone', Venue.phone),
+    ('website', Venue.website),
+    ('facebook_link', Venue.facebook_link),
+    ('seeking_talent', Venue.seeking_talent),
+    ('seeking_description', Venue.seeking_description),
+    ('image_link', Venue.image_link),
+    ('num_upcoming_shows', Venue.num_upcoming_shows),
+]), sort=(Venue.name, Venue.id))
+
+# The venues page groups venues by city and state, so it pages through
+# them area by area; each area's venues arrive together.
+venue_areas = Resource(Venue, venues.fields, sort=(Venue.state, Venue.city, Venue.name, Venue.id))
+
+artists = Resource(Artist, OrderedDict([
+    ('id', Artist.id),
+    ('name', Artist.name),
+    ('genres', Artist.genres),
+    ('city', Artist.city),
+    ('state', Artist.state),
+    ('phone', Artist.phone),
+    ('website', Artist.website),
+    ('facebook_link', Artist.facebook_link),
+    ('seeking_venue', Artist.seeking_venue),
+    ('seeking_description', Artist.seeking_description),
+    ('image_link', Artist.image_link),
+    ('num_upcoming_shows', Artist.num_upcoming_shows),
+]), sort=(Artist.name, Artist.id))
+
+shows = Resource(Show, OrderedDict([
+    ('id', Show.id),
+    ('start_time', Show.start_time),
+    ('duration', Show.duration),
+    ('venue_id', Show.venue_id),
+    ('venue_name', Venue.name),
+    ('venue_image_link', Venue.image_link),
+    ('venue_city', Venue.city),
+    ('artist_id', Show.artist_id),
+    ('artist_name', Artist.name),
+    ('artist_image_link', Artist.image_link),
+]), sort=(Show.start_time, Show.id), joins={
+    Venue: Show.venue_id == Venue.id,
+    Artist: Show.artist_id == Artist.id,
+})
+
+# Fields of the summaries on listing and search pages.
+venue_summary_fields = ['id', 'name', 'num_upcoming_shows']
+artist_summary_fields = ['id', 'name']
+show_summary_fields = ['venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time']
+search_result_fields = ['id', 'name', 'num_upcoming_shows']
+
+
+#----------------------------------------------------------------------------#
+# Show windows.
+#----------------------------------------------------------------------------#
+
+def show_window(query, start, end, city=None):
+    '''Restrict a shows query to those starting in [start, end), optionally in one city.
+
+    The query must already join Venue when filtering by city.
+    '''
+    query = query.filter(Show.start_time >= start, Show.start_time < end)
+    if city:
+        query = query.filter(db.func.lower(Venue.city) == city.lower())
+    return query
+
+
+def shows_per_day(start, end, city=None):
+    '''(date, number of shows) for each day of the window that has shows.'''
+    day = db.func.date(Show.start_time, type_=db.Date)
+    query = db.session.query(day, db.func.count(Show.id))
+    if city:
+        query = query.join(Venue, Show.venue_id == Venue.id)
+    return show_window(query, start, end, city).group_by(day).order_by(day).all()
+
+
+#----------------------------------------------------------------------------#
+# Detail pages.
+#----------------------------------------------------------------------------#
+
+def load_venue(venue_id):
+    '''The venue, its shows and each show's artist in one joined query.'''
+    return Venue.query.options(
+        db.joinedload(Venue.show_list).joinedload(Show.artist).load_only('id', 'name', 'image_link')
+    ).filter(Venue.id == venue_id).one_or_none()
+
+
+def load_artist(artist_id):
+    '''The artist, its shows and each show's venue in one joined query.'''
+    return Artist.query.options(
+        db.joinedload(Artist.show_list).joinedload(Show.venue).load_only('id', 'name', 'image_link')
+    ).filter(Artist.id == artist_id).one_or_none()
+
+
+def split_shows(show_list, counterpart):
+    '''Past and upcoming show payloads, with the `counterpart` side's details.'''
+    current_time = datetime.now()
+    past_shows = []
+    upcoming_shows = []
+    for show in show_list:
+        other = getattr(show, counterpart)
+        bucket = upcoming_shows if show.start_time > current_time else past_shows
+        bucket.append({
+            counterpart + "_id": other.id,
+            counterpart + "_name": other.name,
+            counterpart + "_image_link": other.image_link,
+            "start_time": show.start_time
+        })
+    return past_shows, upcoming_shows
+
+
+def venue_detail(venue):
+    past_shows, upcoming_shows = split_shows(venue.show_list, 'artist')
+    return {
+        "id": venue.id,
+        "name": venue.name,
+        "genres": venue.genres,
+        "address": venue.address,
+        "city": venue.city,
+        "state": venue.state,
+        "phone": venue.phone,
+        "website": venue.website,
+        "facebook_link": venue.facebook_link,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
+        "image_link": venue.image_link,
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
+    }
+
+
+def artist_detail(artist):
+    past_shows, upcoming_shows = split_shows(artist.show_list, 'venue')
+    return {
+        "id": artist.id,
+        "name": artist.name,
+        "genres": artist.genres,
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "website": artist.website,
+        "facebook_link": artist.facebook_link,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+        "image_link": artist.image_link,
+        "past_shows": past_shows,
+        "upcoming_shows": upcoming_shows,
+        "past_shows_count": len(past_shows),
+        "upcoming_shows_count": len(upcoming_shows),
+    }
@@ -0,0 +1,142 @@
+import itertools
+import threading
+import time
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+
+# GET and HEAD requests read from one of SQLALCHEMY_REPLICA_URIS, picked per
+# session (round-robin, or the replica with the fewest connections checked
+# out). Everything else goes to the primary: other methods, CLI commands,
+# every statement of a session once it has written, and for
+# REPLICA_PIN_SECONDS after a write, the same browser's next requests, so
+# the redirect after a form post does not read from a lagging replica. The
+# pin is a plain cookie: tampering with it only changes where reads go.
+
+read_methods = ('GET', 'HEAD')
+pin_cookie = 'primary_until'
+strategies = ('round_robin', 'least_loaded')
+
+
+class Replica(object):
+    def __init__(self, engine):
+        self.engine = engine
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        event.listen(engine, 'checkout', self.checked_out)
+        event.listen(engine, 'checkin', self.checked_in)
+
+    def checked_out(self, dbapi_connection, connection_record, connection_proxy):
+        with self.lock:
+            self.in_flight += 1
+
+    def checked_in(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.in_flight -= 1
+
+
+class ReplicaSet(object):
+    def __init__(self, engines, strategy):
+        if strategy not in strategies:
+            raise ValueError('Unknown REPLICA_STRATEGY %r' % strategy)
+        self.replicas = [Replica(engine) for engine in engines]
+        self.choose = getattr(self, strategy)
+        self.turns = itertools.count()
+
+    def round_robin(self):
+        return self.replicas[next(self.turns) % len(self.replicas)].engine
+
+    def least_loaded(self):
+        # Rotate the starting point so that ties are shared out.
+        start = next(self.turns)
+        rotated = self.replicas[start % len(self.replicas):] + self.replicas[:start % len(self.replicas)]
+        return min(rotated, key=lambda replica: replica.in_flight).engine
+
+
+def create_engine(app, db, replica):
+    '''An engine for one SQLALCHEMY_REPLICA_URIS entry (a URI or a dict).'''
+    options = {'uri': replica} if isinstance(replica, str) else dict(replica)
+    sa_url = make_url(options.pop('uri'))
+    engine_options = {}
+    db.apply_pool_defaults(app, engine_options)
+    engine_options.update(app.config['SQLALCHEMY_REPLICA_ENGINE_OPTIONS'])
+    engine_options.update(options)
+    db.apply_driver_hacks(app, sa_url, engine_options)
+    return db.create_engine(sa_url, engine_options)
+
+
+def get_replicas(app, db):
+    '''The app's ReplicaSet, or None without replicas; engines are created on first use.'''
+    replicas = app.extensions.get('replicas')
+    if replicas is None:
+        uris = app.config['SQLALCHEMY_REPLICA_URIS']
+        replicas = ReplicaSet([create_engine(app, db, uri) for uri in uris], app.config['REPLICA_STRATEGY']) \
+            if uris else False
+        app.extensions['replicas'] = replicas
+    return replicas or None
+
+
+def reads_from_replica():
+    if not has_request_context() or request.method not in read_methods:
+        return False
+    try:
+        pinned_until = float(request.cookies.get(pin_cookie, 0))
+    except ValueError:
+        pinned_until = 0
+    return pinned_until <= time.time()
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if isinstance(clause, UpdateBase):
+            # Bulk query.update()/delete() do not go through a flush.
+            written(self)
+        elif not self._flushing and not self.info.get('wrote'):
+            replica = self.info.get('replica')
+            if replica is None:
+                replicas = get_replicas(self.app, self.db)
+                if replicas is not None and reads_from_replica():
+                    replica = self.info['replica'] = replicas.choose()
+            if replica is not None:
+                return replica
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def written(session):
+    session.info['wrote'] = True
+    pin = session.app.config['REPLICA_PIN_SECONDS']
+    if pin and has_request_context():
+        g.primary_until = time.time() + pin
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def after_flush(session, flush_context):
+    written(session)
+
+
+def set_pin_cookie(response):
+    primary_until = g.get('primary_until')
+    if primary_until is not None:
+        response.set_cookie(pin_cookie, '%.3f' % primary_until,
+                            max_age=int(primary_until - time.time()) + 1, httponly=True)
+    return response
+
+
+def init_app(app):
+    app.after_request(set_pin_cookie)
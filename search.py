@@ -0,0 +1,232 @@
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from models import db, show_foreign_keys
+from forms import genre_choices
+from payloads import search_result_fields
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# Venues and artists are matched on name, city and genres. A name match ranks
+# above a city match, which ranks above a genre match; ties are broken by
+# trigram similarity of the name to the search term. Upcoming-show counts come
+# from the maintained counters (see counters.py).
+NAME_WEIGHT = 4
+NAME_PREFIX_WEIGHT = 2
+CITY_WEIGHT = 2
+GENRE_WEIGHT = 1
+
+class SearchResults(object):
+    def __init__(self, count, data):
+        self.count = count
+        self.data = data
+
+
+def matching_genres(term):
+    term = term.lower()
+    return [genre for genre, label in genre_choices if term in genre.lower()]
+
+
+def result_query(model, *columns):
+    return db.session.query(*[getattr(model, field) for field in search_result_fields] + list(columns))
+
+
+def result_row(row):
+    return {field: getattr(row, field) for field in search_result_fields}
+
+
+class SearchBackend(object):
+    def search(self, model, term, limit):
+        raise NotImplementedError
+
+    def invalidate(self, model):
+        pass
+
+
+class SqlSearchBackend(SearchBackend):
+    '''Ranks and counts in the database in a single query.
+
+    On Postgres the ILIKE predicates are served by the pg_trgm GIN indexes and
+    the genre overlap by the GIN index on the `genres` array.
+    '''
+
+    def search(self, model, term, limit):
+        pattern = '%' + escape_like(term) + '%'
+        name_match = model.name.ilike(pattern, escape='\\')
+        city_match = model.city.ilike(pattern, escape='\\')
+        predicates = [name_match, city_match]
+        genres = matching_genres(term)
+        if genres:
+            genre_match = model.genres.op('&&')(db.cast(postgresql.array(genres), db.ARRAY(db.String)))
+            predicates.append(genre_match)
+        rank = db.case([(name_match, NAME_WEIGHT)], else_=0) \
+            + db.case([(db.func.lower(model.name).like(escape_like(term.lower()) + '%', escape='\\'), NAME_PREFIX_WEIGHT)], else_=0) \
+            + db.case([(city_match, CITY_WEIGHT)], else_=0)
+        if genres:
+            rank = rank + db.case([(genre_match, GENRE_WEIGHT)], else_=0)
+        rows = result_query(model, db.func.count().over().label('total')) \
+            .filter(db.or_(*predicates)) \
+            .order_by(rank.desc(), db.func.similarity(model.name, term).desc(), model.name, model.id) \
+            .limit(limit) \
+            .all()
+        return SearchResults(rows[0].total if rows else 0, [result_row(row) for row in rows])
+
+
+class MemorySearchBackend(SearchBackend):
+    '''In-process trigram inverted index for databases without trigram indexes.
+
+    The index is built from the database on first use and rebuilt lazily after
+    a venue or artist changes in this process, or once it is older than
+    SEARCH_INDEX_MAX_AGE seconds to pick up writes made elsewhere. Only the top `limit` matches go back to the
+    database, in one query, to pick up their upcoming-show counts.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = {}
+
+    def invalidate(self, model):
+        with self.lock:
+            self.indexes.pop(model, None)
+
+    def index(self, model):
+        with self.lock:
+            index = self.indexes.get(model)
+            if index is None or index.built_at + current_app.config['SEARCH_INDEX_MAX_AGE'] < time.monotonic():
+                rows = db.session.query(model.id, model.name, model.city, model.genres)
+                index = self.indexes[model] = InvertedIndex(rows)
+            return index
+
+    def search(self, model, term, limit):
+        matches = self.index(model).search(term)
+        ids = [doc_id for doc_id, rank in matches[:limit]]
+        rows = result_query(model).filter(model.id.in_(ids)).all() if ids else []
+        order = {doc_id: position for position, doc_id in enumerate(ids)}
+        rows.sort(key=lambda row: order[row.id])
+        return SearchResults(len(matches), [result_row(row) for row in rows])
+
+
+class InvertedIndex(object):
+    def __init__(self, rows):
+        self.built_at = time.monotonic()
+        self.documents = {}
+        self.postings = {}
+        for doc_id, name, city, genres in rows:
+            fields = ((name or '').lower(), (city or '').lower(), [genre.lower() for genre in genres or []])
+            self.documents[doc_id] = fields
+            for text in [fields[0], fields[1]] + fields[2]:
+                for gram in substring_trigrams(text):
+                    self.postings.setdefault(gram, set()).add(doc_id)
+
+    def candidates(self, term):
+        grams = substring_trigrams(term)
+        if not grams:
+            # Terms shorter than a trigram can only be answered by a scan.
+            return self.documents.keys()
+        postings = sorted((self.postings.get(gram, ()) for gram in grams), key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+    def search(self, term):
+        term = term.lower()
+        term_grams = similarity_trigrams(term)
+        matches = []
+        for doc_id in self.candidates(term):
+            name, city, genres = self.documents[doc_id]
+            rank = 0
+            if term in name:
+                rank += NAME_WEIGHT
+                if name.startswith(term):
+                    rank += NAME_PREFIX_WEIGHT
+            if term in city:
+                rank += CITY_WEIGHT
+            if any(term in genre for genre in genres):
+                rank += GENRE_WEIGHT
+            if rank:
+                matches.append((doc_id, rank, similarity(term_grams, similarity_trigrams(name)), name))
+        matches.sort(key=lambda match: (-match[1], -match[2], match[3], match[0]))
+        return [(doc_id, rank) for doc_id, rank, _, _ in matches]
+
+
+def substring_trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity_trigrams(text):
+    # Word trigrams padded the way pg_trgm pads them, so both backends break
+    # ties the same way.
+    grams = set()
+    for word in ''.join(c if c.isalnum() else ' ' for c in text).split():
+        grams |= substring_trigrams('  ' + word + ' ')
+    return grams
+
+
+def similarity(a, b):
+    union = len(a | b)
+    return len(a & b) / union if union else 0.0
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+#----------------------------------------------------------------------------#
+# Backend selection.
+#----------------------------------------------------------------------------#
+
+backends = {
+    'sql': SqlSearchBackend,
+    'memory': MemorySearchBackend,
+}
+
+
+def init_app(app):
+    app.extensions['search'] = None
+
+
+def get_backend():
+    backend = current_app.extensions['search']
+    if backend is None:
+        name = current_app.config.get('SEARCH_BACKEND')
+        if name is None:
+            name = 'sql' if db.engine.dialect.name == 'postgresql' else 'memory'
+        backend = current_app.extensions['search'] = backends[name]()
+    return backend
+
+
+def search(model, term):
+    return get_backend().search(model, term, current_app.config['SEARCH_RESULT_LIMIT'])
+
+
+def invalidate(model):
+    if has_app_context() and current_app.extensions.get('search') is not None:
+        current_app.extensions['search'].invalidate(model)
+
+
+def mark_changed(session, model):
+    '''Invalidate `model`'s index once `session` commits.'''
+    session.info.setdefault('search_changed', set()).add(model)
+
+
+def record_changes(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if type(obj) in show_foreign_keys:
+            mark_changed(session, type(obj))
+
+
+def invalidate_changed(session):
+    for model in session.info.pop('search_changed', ()):
+        invalidate(model)
+
+
+def discard_changes(session):
+    session.info.pop('search_changed', None)
+
+
+db.event.listen(Session, 'after_flush', record_changes)
+db.event.listen(Session, 'after_commit', invalidate_changed)
+db.event.listen(Session, 'after_rollback', discard_changes)
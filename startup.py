@@ -0,0 +1,31 @@
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+#----------------------------------------------------------------------------#
+# Startup.
+#----------------------------------------------------------------------------#
+
+# Templates are compiled once per worker at startup instead of on the first
+# request that needs each one, and the compiled code is kept in
+# TEMPLATE_BYTECODE_CACHE_DIR so that later workers (and restarts) only load
+# it. Entries are keyed by the template source, so edits are picked up.
+
+
+def precompile_templates(app):
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def init_app(app, started):
+    '''Set up the bytecode cache, warm the templates and log the startup time.'''
+    cache_dir = app.config['TEMPLATE_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    templates = precompile_templates(app) if app.config['PRECOMPILE_TEMPLATES'] else 0
+    app.extensions['startup_ms'] = (time.perf_counter() - started) * 1000
+    app.logger.info('Started in %.0f ms (%d templates precompiled)', app.extensions['startup_ms'], templates)
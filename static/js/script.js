@@ -2,3 +2,38 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Name suggestions for the search boxes, from /suggest as you type.
+document.addEventListener('DOMContentLoaded', function () {
+  var inputs = document.querySelectorAll('input[data-suggest]');
+  Array.prototype.forEach.call(inputs, function (input) {
+    var list = document.getElementById(input.getAttribute('list'));
+    var timer = null;
+    var latest = '';
+    input.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var term = input.value.trim();
+        latest = term;
+        if (!term) {
+          list.innerHTML = '';
+          return;
+        }
+        var url = '/suggest?type=' + input.getAttribute('data-suggest') + '&q=' + encodeURIComponent(term);
+        fetch(url).then(function (response) {
+          return response.json();
+        }).then(function (data) {
+          if (term !== latest) {
+            return;
+          }
+          list.innerHTML = '';
+          data.suggestions.forEach(function (suggestion) {
+            var option = document.createElement('option');
+            option.value = suggestion.name;
+            list.appendChild(option);
+          });
+        });
+      }, 100);
+    });
+  });
+});
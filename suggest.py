@@ -0,0 +1,356 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from flask import current_app, has_app_context, url_for
+from sqlalchemy.orm import Session, attributes
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Name suggestions.
+#----------------------------------------------------------------------------#
+
+# /suggest?q= answers from an in-process sorted array of (word, id) keys, one
+# per word of each venue and artist name, searched with bisect; the most
+# booked matches come first. It is loaded before the first request and
+# patched when this process commits a change to a name or to the upcoming-show
+# counters. Once older than SUGGEST_INDEX_MAX_AGE seconds it is rebuilt in a
+# background thread, to pick up writes made elsewhere, while requests keep
+# answering from the old one.
+
+kinds = {
+    'venue': Venue,
+    'artist': Artist,
+}
+
+# Keys are also bucketed by their first BUCKET_LENGTH characters, each
+# bucket sorted best first, so that short prefixes (which match many names)
+# merge the heads of a few buckets instead of scanning every match. Longer
+# prefixes that match more than SCAN_LIMIT keys keep a list of their own,
+# sorted best first, and the rest are few enough to scan: a lookup reads
+# about `limit` entries, or at most SCAN_LIMIT keys.
+BUCKET_LENGTH = 3
+SCAN_LIMIT = 64
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def name_keys(name):
+    '''Every suffix of the name that starts a word: 'the musical hop', 'musical hop', 'hop'.'''
+    words = normalize(name).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+
+def rank(listing_id, name, upcoming):
+    return -upcoming, name.lower(), listing_id
+
+
+def prefix_end(prefix):
+    '''The smallest string above every string that starts with `prefix`.'''
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class PrefixIndex(object):
+    def __init__(self, rows):
+        self.built_at = time.monotonic()
+        self.outdated = False
+        self.listings = {}
+        self.ranks = {}
+        self.keys = []
+        self.buckets = {}
+        for listing_id, name, upcoming in rows:
+            listing = self.listings[listing_id] = (name, upcoming or 0)
+            listing_rank = self.ranks[listing_id] = rank(listing_id, *listing)
+            for key in name_keys(name):
+                self.keys.append((key, listing_id))
+                self.buckets.setdefault(key[:BUCKET_LENGTH], []).append(listing_rank)
+        self.keys.sort()
+        for bucket in self.buckets.values():
+            bucket.sort()
+        self.bucket_names = sorted(self.buckets)
+        self.ranked = {}
+        self.rank_prefixes(BUCKET_LENGTH + 1, 0, len(self.keys))
+
+    def rank_prefixes(self, length, start, end):
+        '''Rank the prefixes of `length` among keys[start:end] that match more than SCAN_LIMIT keys.'''
+        while start < end:
+            key = self.keys[start][0]
+            if len(key) < length:
+                start += 1
+                continue
+            prefix = key[:length]
+            prefix_stop = bisect_left(self.keys, (prefix_end(prefix),), start, end)
+            if prefix_stop - start > SCAN_LIMIT:
+                self.ranked[prefix] = sorted({self.ranks[listing_id] for _, listing_id in self.keys[start:prefix_stop]})
+                self.rank_prefixes(length + 1, start, prefix_stop)
+            start = prefix_stop
+
+    def long_prefixes(self, name):
+        return {key[:length] for key in name_keys(name) for length in range(BUCKET_LENGTH + 1, len(key) + 1)}
+
+    def add(self, listing_id, name, upcoming):
+        self.remove(listing_id)
+        listing = self.listings[listing_id] = (name, upcoming or 0)
+        listing_rank = self.ranks[listing_id] = rank(listing_id, *listing)
+        for key in name_keys(name):
+            insort(self.keys, (key, listing_id))
+            bucket_name = key[:BUCKET_LENGTH]
+            if bucket_name not in self.buckets:
+                self.buckets[bucket_name] = []
+                insort(self.bucket_names, bucket_name)
+            insort(self.buckets[bucket_name], listing_rank)
+        for prefix in self.long_prefixes(name):
+            if prefix in self.ranked:
+                insort(self.ranked[prefix], listing_rank)
+                continue
+            start = bisect_left(self.keys, (prefix,))
+            prefix_stop = bisect_left(self.keys, (prefix_end(prefix),), start)
+            # The new keys may take a prefix past SCAN_LIMIT.
+            if prefix_stop - start > SCAN_LIMIT:
+                self.ranked[prefix] = sorted({self.ranks[other_id] for _, other_id in self.keys[start:prefix_stop]})
+
+    def remove(self, listing_id):
+        listing = self.listings.pop(listing_id, None)
+        if listing is None:
+            return
+        listing_rank = self.ranks.pop(listing_id)
+        for key in name_keys(listing[0]):
+            remove_sorted(self.keys, (key, listing_id))
+            bucket_name = key[:BUCKET_LENGTH]
+            bucket = self.buckets[bucket_name]
+            remove_sorted(bucket, listing_rank)
+            if not bucket:
+                del self.buckets[bucket_name]
+                remove_sorted(self.bucket_names, bucket_name)
+        for prefix in self.long_prefixes(listing[0]):
+            if prefix in self.ranked:
+                remove_sorted(self.ranked[prefix], listing_rank)
+
+    def matches(self, prefix, limit):
+        '''Up to `limit` (id, name, upcoming) whose name has a word starting with `prefix`.'''
+        if len(prefix) > BUCKET_LENGTH:
+            ranked = self.ranked.get(prefix)
+            if ranked is not None:
+                ranked = ranked[:limit]
+            else:
+                start = bisect_left(self.keys, (prefix,))
+                prefix_stop = bisect_left(self.keys, (prefix_end(prefix),), start)
+                ranked = heapq.nsmallest(limit, {self.ranks[listing_id] for _, listing_id in self.keys[start:prefix_stop]})
+        else:
+            buckets = []
+            index = bisect_left(self.bucket_names, prefix)
+            while index < len(self.bucket_names) and self.bucket_names[index].startswith(prefix):
+                buckets.append(self.buckets[self.bucket_names[index]])
+                index += 1
+            ranked = []
+            seen = set()
+            for listing_rank in heapq.merge(*buckets):
+                if listing_rank[2] not in seen:
+                    seen.add(listing_rank[2])
+                    ranked.append(listing_rank)
+                    if len(ranked) == limit:
+                        break
+        return [(listing_id,) + self.listings[listing_id] for _, _, listing_id in ranked]
+
+
+def remove_sorted(items, item):
+    index = bisect_left(items, item)
+    if index < len(items) and items[index] == item:
+        del items[index]
+
+
+class Suggestions(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = {}
+        # Per model being rebuilt, the changes to replay on the new index.
+        self.rebuilding = {}
+        # Per model, the listings whose upcoming-show counts changed (None: all).
+        self.recounted = {}
+        self.threads = {}
+
+    def start_rebuild(self, model):
+        # Callers hold the lock.
+        if model in self.rebuilding:
+            return False
+        self.rebuilding[model] = []
+        return True
+
+    def rebuild(self, model):
+        '''Read a new index for `model`, without the lock, and swap it in.'''
+        try:
+            index = PrefixIndex(db.session.query(model.id, model.name, model.num_upcoming_shows))
+        except Exception:
+            with self.lock:
+                del self.rebuilding[model]
+            raise
+        with self.lock:
+            # Changes committed while the rows were read; replaying one the
+            # rows already include is harmless.
+            for listing_id, name, upcoming in self.rebuilding.pop(model):
+                apply_change(index, listing_id, name, upcoming)
+            self.indexes[model] = index
+
+    def rebuild_in_background(self, model):
+        app = current_app._get_current_object()
+
+        def run():
+            with app.app_context():
+                try:
+                    self.rebuild(model)
+                except Exception:
+                    app.logger.exception('Rebuilding the %s suggestions failed', model.__name__)
+
+        thread = self.threads[model] = threading.Thread(target=run, name='suggest-%s' % model.__name__, daemon=True)
+        thread.start()
+
+    def index(self, model):
+        with self.lock:
+            index = self.indexes.get(model)
+            stale = index is not None and (
+                index.outdated or index.built_at + current_app.config['SUGGEST_INDEX_MAX_AGE'] < time.monotonic())
+            rebuild = (index is None or stale) and self.start_rebuild(model)
+        if index is None and rebuild:
+            self.rebuild(model)
+            with self.lock:
+                index = self.indexes[model]
+        elif index is None:
+            # Another request is loading it; answer without suggestions meanwhile.
+            return PrefixIndex(())
+        elif rebuild:
+            self.rebuild_in_background(model)
+        return index
+
+    def load(self):
+        '''Build every index now, after any background rebuild, with the latest counts.'''
+        for model in kinds.values():
+            thread = self.threads.pop(model, None)
+            if thread is not None:
+                thread.join()
+            with self.lock:
+                self.recounted.pop(model, None)
+                rebuild = self.start_rebuild(model)
+            if rebuild:
+                self.rebuild(model)
+
+    def apply(self, changes):
+        with self.lock:
+            for model, listing_id, name, upcoming in changes:
+                if model in self.rebuilding:
+                    self.rebuilding[model].append((listing_id, name, upcoming))
+                index = self.indexes.get(model)
+                if index is not None:
+                    apply_change(index, listing_id, name, upcoming)
+
+    def recount(self, model, listing_ids=None):
+        with self.lock:
+            recounted = self.recounted.get(model, set())
+            if listing_ids is None or recounted is None:
+                self.recounted[model] = None
+            else:
+                self.recounted[model] = recounted | set(listing_ids)
+
+    def refresh_counts(self, models):
+        '''Re-read the listings whose counts changed since the last lookup.'''
+        with self.lock:
+            recounted = [(model, self.recounted.pop(model)) for model in models if model in self.recounted]
+            for model, listing_ids in recounted:
+                if listing_ids is None and model in self.indexes:
+                    # Too many to re-read one by one: rebuild in the background.
+                    self.indexes[model].outdated = True
+        for model, listing_ids in recounted:
+            if listing_ids is None:
+                continue
+            rows = db.session.query(model.id, model.name, model.num_upcoming_shows) \
+                .filter(model.id.in_(listing_ids))
+            self.apply([(model,) + tuple(row) for row in rows])
+
+    def suggest(self, prefix, models, limit):
+        self.refresh_counts(models)
+        results = []
+        for kind, model in kinds.items():
+            if model in models:
+                index = self.index(model)
+                with self.lock:
+                    results += [(kind,) + match for match in index.matches(prefix, limit)]
+        results.sort(key=lambda result: (-result[3], result[2].lower(), result[0], result[1]))
+        return results[:limit]
+
+
+def apply_change(index, listing_id, name, upcoming):
+    if name is None:
+        index.remove(listing_id)
+    else:
+        index.add(listing_id, name, upcoming)
+
+
+def init_app(app):
+    app.extensions['suggest'] = Suggestions()
+    if app.config['SUGGEST_PRELOAD']:
+        app.before_first_request(app.extensions['suggest'].load)
+
+
+def suggest(term, kind=None):
+    '''Suggestion payloads for names with a word starting with `term`.'''
+    prefix = normalize(term)
+    if not prefix:
+        return []
+    models = [kinds[kind]] if kind in kinds else kinds.values()
+    limit = current_app.config['SUGGEST_LIMIT']
+    return [{
+        'type': kind,
+        'id': listing_id,
+        'name': name,
+        'num_upcoming_shows': upcoming,
+        'url': url_for('show_%s' % kind, **{'%s_id' % kind: listing_id}),
+    } for kind, listing_id, name, upcoming in current_app.extensions['suggest'].suggest(prefix, models, limit)]
+
+
+#----------------------------------------------------------------------------#
+# Keeping the index current.
+#----------------------------------------------------------------------------#
+
+def record(session, model, listing_id, name=None, upcoming=0):
+    '''Add (or, without a name, remove) a listing once `session` commits.'''
+    session.info.setdefault('suggest_changes', []).append((model, listing_id, name, upcoming))
+
+
+def record_changes(session, flush_context):
+    for obj in session.new:
+        if type(obj) in kinds.values():
+            record(session, type(obj), obj.id, obj.name, obj.num_upcoming_shows)
+    for obj in session.dirty:
+        if type(obj) in kinds.values() and attributes.get_history(obj, 'name').has_changes():
+            record(session, type(obj), obj.id, obj.name, obj.num_upcoming_shows)
+    for obj in session.deleted:
+        if type(obj) in kinds.values():
+            record(session, type(obj), obj.id)
+
+
+def record_counts(session, model, listing_ids=None):
+    '''Re-read the upcoming-show counts of the listings (all of `model` without ids) once `session` commits.'''
+    session.info.setdefault('suggest_recounts', []).append((model, listing_ids))
+
+
+def apply_changes(session):
+    changes = session.info.pop('suggest_changes', None)
+    recounts = session.info.pop('suggest_recounts', None)
+    if not (has_app_context() and 'suggest' in current_app.extensions):
+        return
+    if changes:
+        current_app.extensions['suggest'].apply(changes)
+    for model, listing_ids in recounts or ():
+        current_app.extensions['suggest'].recount(model, listing_ids)
+
+
+def discard_changes(session):
+    session.info.pop('suggest_changes', None)
+    session.info.pop('suggest_recounts', None)
+
+
+db.event.listen(Session, 'after_flush', record_changes)
+db.event.listen(Session, 'after_commit', apply_changes)
+db.event.listen(Session, 'after_rollback', discard_changes)